@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Lets servers supporting the zero-copy send extension serve blobs with os.sendfile
+from files.streaming import ZeroCopyFileMiddleware  # noqa: E402
+
+application = ZeroCopyFileMiddleware(application)
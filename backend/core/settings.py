@@ -154,6 +154,28 @@ COOKIE_SECURE = os.getenv('COOKIE_SECURE', 'True').lower() == 'true'
 COOKIE_HTTPONLY = os.getenv('COOKIE_HTTPONLY', 'True').lower() == 'true'
 SAME_SITE = 'Strict'
 
+# jwt_required takes the user's id, username, role and MFA state from a bounded in-process cache
+# instead of loading the User on every request, the model is only loaded if a view needs more.
+# Entries are dropped when the User is saved or deleted in this process and expire after the TTL in others.
+JWT_CLAIMS_AUTH = os.getenv('JWT_CLAIMS_AUTH', 'True').lower() == 'true'
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TTL_SECONDS = int(os.getenv('AUTH_USER_CACHE_TTL_SECONDS', 60))
+
+# Requests refreshing an expired access token with the same refresh token within this window
+# share the access token minted by the first of them, keyed by a hash of the refresh token.
+JWT_REFRESH_GRACE_SECONDS = int(os.getenv('JWT_REFRESH_GRACE_SECONDS', 30))
+JWT_REFRESH_CACHE_SIZE = 10000
+
+# Verified access token payloads kept so repeat requests skip the signature check and JSON decode.
+# Entries expire at the token's exp. 0 disables the cache.
+JWT_DECODE_CACHE_SIZE = int(os.getenv('JWT_DECODE_CACHE_SIZE', 10000))
+
+# Parsed RSA private keys kept by the KMS so decrypts skip PEM parsing, capped by count and by
+# estimated memory. Entries are dropped when their KeyPair is saved or deleted and expire after the TTL.
+KMS_KEY_CACHE_SIZE = int(os.getenv('KMS_KEY_CACHE_SIZE', 1000))
+KMS_KEY_CACHE_MAX_BYTES = int(os.getenv('KMS_KEY_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+KMS_KEY_CACHE_TTL_SECONDS = int(os.getenv('KMS_KEY_CACHE_TTL_SECONDS', 600))
+
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOWED_ORIGINS = [
     "https://localhost:3000",  
@@ -179,6 +201,19 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'range',
+    'if-range',
+    'if-none-match',
+]
+
+# Response headers the frontend is allowed to read
+CORS_EXPOSE_HEADERS = [
+    'accept-ranges',
+    'content-range',
+    'content-length',
+    'etag',
+    'x-file-name',
+    'x-encrypted-key',
 ]
 
 
@@ -201,6 +236,37 @@ CSRF_TRUSTED_ORIGINS = [
 FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 UPLOAD_DIR = 'encrypted_files'  # Directory for storing encrypted files
+UPLOAD_MAX_FILE_SIZE = 1024 * 1024 * 1024  # 1GB, uploads are streamed to disk so this does not affect memory
+# Storage each user may use unless StorageUsage.quota_bytes overrides it, unset means unlimited
+DEFAULT_STORAGE_QUOTA_BYTES = int(os.getenv('DEFAULT_STORAGE_QUOTA_BYTES')) if os.getenv('DEFAULT_STORAGE_QUOTA_BYTES') else None
+UPLOAD_DIR_FANOUT_DEPTH = 2  # Levels of hash-prefixed sub directories blobs are spread over
+UPLOAD_STAGING_DIR = os.path.join(UPLOAD_DIR, 'staging')  # Partially uploaded files of upload sessions
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Default chunk size of upload sessions
+UPLOAD_CHUNK_MAX_SIZE = 64 * 1024 * 1024
+UPLOAD_SESSION_MAX_SIZE = 10 * 1024 * 1024 * 1024  # 10GB
+UPLOAD_SESSION_EXPIRATION_HOURS = 24
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Block size used when streaming encrypted files
+DOWNLOAD_MAX_RANGES = 16  # Range requests with more ranges than this are served in full
+BULK_MAX_FILES = 1000  # Max files handled by one bulk request
+DELETE_BATCH_SIZE = 500  # Files deleted per transaction, their blobs are unlinked by `manage.py reclaim_blobs`
+DATA_UPLOAD_MAX_NUMBER_FILES = BULK_MAX_FILES
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 2 * BULK_MAX_FILES + 100  # file_name and encrypted_key per batch-uploaded file
+
+# How raw downloads are served once authorized:
+#   'django'           - streamed by Django (WSGI servers with wsgi.file_wrapper use sendfile for full downloads)
+#   'x-accel-redirect' - nginx serves FILE_SERVE_INTERNAL_URL, an `internal` location aliased to UPLOAD_DIR
+#   'x-sendfile'       - Apache mod_xsendfile / lighttpd serve the absolute blob path
+#   'sendfile'         - zero-copy via the ASGI `http.response.zerocopysend` extension when available
+# With a fronting proxy, forward X-File-Name and X-Encrypted-Key from the upstream response.
+FILE_SERVE_BACKEND = os.getenv('FILE_SERVE_BACKEND', 'django')
+FILE_SERVE_INTERNAL_URL = os.getenv('FILE_SERVE_INTERNAL_URL', '/protected-files/')
+
+# Cache of each user's share permission on a file, dropped whenever the FileShare changes.
+# 'local' is a per-process LRU, exact for the single runsslserver process. When running several
+# processes, name a shared CACHES alias instead so revocations reach all of them. '' disables it.
+FILE_PERMISSION_CACHE = os.getenv('FILE_PERMISSION_CACHE', 'local')
+FILE_PERMISSION_CACHE_SIZE = 50000
+FILE_PERMISSION_CACHE_TTL_SECONDS = 300
 
 # Add these settings for admin security
 ADMIN_URL = os.getenv('ADMIN_URL', 'admin/')  # Customize admin URL
@@ -210,4 +276,8 @@ ADMIN_SITE_HEADER = "Your App Admin"
 ADMIN_SITE_TITLE = "Your App Admin Portal"
 ADMIN_INDEX_TITLE = "Welcome to Your App Admin Portal"
 
-DEFAULT_EXPIRATION_MINUTES = 60 
\ No newline at end of file
+DEFAULT_EXPIRATION_MINUTES = 60
+
+# Keyset pagination of list endpoints, used when a client passes ?page_size= or ?cursor=
+LIST_PAGE_SIZE = 50
+LIST_MAX_PAGE_SIZE = 500
@@ -0,0 +1,131 @@
+import secrets
+import threading
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from utils.lru import LRUCache
+from .models import File, FileShare
+
+# share_permission is the permission_type of the file's share with the user, None if not shared
+FileAccess = namedtuple('FileAccess', ['is_owner', 'share_permission'])
+
+PERMISSION_CACHE_LOCAL = 'local'
+NOT_SHARED = ''  # Cached for users without a share, so their lookups are cached too
+
+share_permission_cache = LRUCache(settings.FILE_PERMISSION_CACHE_SIZE, settings.FILE_PERMISSION_CACHE_TTL_SECONDS)
+invalidation_lock = threading.Lock()
+invalidations = 0
+
+
+def share_permission_subquery(user, file_ref='pk'):
+    """Annotation with the permission of the share of OuterRef(file_ref) with `user`"""
+    return Subquery(
+        FileShare.objects.filter(
+            file_id=OuterRef(file_ref),
+            shared_with_username=user.username
+        ).values('permission_type')[:1]
+    )
+
+
+def file_access(file, user, share_permission):
+    return FileAccess(
+        is_owner=file.uploaded_by_id == user.id,
+        share_permission=share_permission
+    )
+
+
+def get_file_with_access(file_id, user):
+    """
+    Load a file with the user's access to it in one query, skipping the
+    share lookup when the permission is cached. Raises File.DoesNotExist.
+    """
+    share_permission, generation = cached_share_permission(file_id, user.username)
+    files = File.objects.select_related('uploaded_by')
+    if share_permission is None:
+        file = files.annotate(share_permission=share_permission_subquery(user)).get(id=file_id)
+        share_permission = file.share_permission
+        cache_share_permission(file_id, user.username, share_permission, generation)
+    else:
+        file = files.get(id=file_id)
+    return file, file_access(file, user, share_permission or None)
+
+
+def shared_cache_key(file_id, username):
+    return f'file-permission:{file_id}:{username}'
+
+
+def shared_generation_key(file_id, username):
+    return f'file-permission-generation:{file_id}:{username}'
+
+
+def cached_share_permission(file_id, username):
+    """
+    (permission, generation): the cached permission, NOT_SHARED, or None on a miss,
+    and the invalidation generation it was read at, to hand to cache_share_permission.
+    """
+    backend = settings.FILE_PERMISSION_CACHE
+    if not backend:
+        return None, None
+    if backend == PERMISSION_CACHE_LOCAL:
+        return share_permission_cache.get((file_id, username)), invalidations
+    # Entries are tagged with their key's generation when they were read. Invalidating
+    # starts a new one, so what another process read before that can no longer match.
+    cache = caches[backend]
+    key, generation_key = shared_cache_key(file_id, username), shared_generation_key(file_id, username)
+    entries = cache.get_many([key, generation_key])
+    generation = entries.get(generation_key)
+    if generation is None:
+        # Start one before the share is read, or an invalidation in between would go unnoticed
+        generation = new_generation()
+        if not cache.add(generation_key, generation, settings.FILE_PERMISSION_CACHE_TTL_SECONDS):
+            generation = cache.get(generation_key)
+        return None, generation
+    entry = entries.get(key)
+    if entry is not None and entry[0] == generation:
+        return entry[1], generation
+    return None, generation
+
+
+def new_generation():
+    return secrets.token_hex(8)
+
+
+def cache_share_permission(file_id, username, share_permission, generation):
+    backend = settings.FILE_PERMISSION_CACHE
+    if not backend:
+        return
+    value = share_permission or NOT_SHARED
+    if backend == PERMISSION_CACHE_LOCAL:
+        # A share changed while we were reading it, what we read may already be stale
+        if generation == invalidations:
+            share_permission_cache.set((file_id, username), value)
+    elif generation is not None:
+        caches[backend].set(
+            shared_cache_key(file_id, username), (generation, value), settings.FILE_PERMISSION_CACHE_TTL_SECONDS
+        )
+
+
+def invalidate_share_permission(file_id, username):
+    """
+    Drop the cached permission right away, so the change applies to the rest of
+    this transaction, and again once it commits, in case it was re-read meanwhile.
+    """
+    global invalidations
+    with invalidation_lock:
+        invalidations += 1
+
+    def drop():
+        backend = settings.FILE_PERMISSION_CACHE
+        if backend == PERMISSION_CACHE_LOCAL:
+            share_permission_cache.pop((file_id, username))
+        elif backend:
+            # Readers in other processes may still write back what they read before this,
+            # but tagged with the previous generation
+            caches[backend].set(
+                shared_generation_key(file_id, username), new_generation(), settings.FILE_PERMISSION_CACHE_TTL_SECONDS
+            )
+
+    drop()
+    transaction.on_commit(drop)
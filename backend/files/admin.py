@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import File, FileShare, ShareableLink
+from django.db.models import Count
+from .deletion import delete_files
+from .models import File, FileShare, ShareableLink, StorageUsage
+from .versions import bump_list_versions
 
 class FileShareInline(admin.TabularInline):
     model = FileShare
@@ -15,10 +18,39 @@ class FileAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
     inlines = [FileShareInline]
+
+    def get_queryset(self, request):
+        # Count shares in the changelist query instead of once per row
+        return super().get_queryset(request).select_related('uploaded_by').annotate(share_count=Count('shares'))
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bump_list_versions(
+            [obj.uploaded_by.username, *obj.shares.values_list('shared_with_username', flat=True)]
+        )
+
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        changed_usernames = {form.instance.uploaded_by.username}
+        for obj in [*formset.new_objects, *formset.deleted_objects, *(obj for obj, _ in formset.changed_objects)]:
+            changed_usernames.add(obj.shared_with_username)
+        for share_form in formset.forms:
+            # A share moved to another recipient leaves the previous one's list too
+            if 'shared_with_username' in share_form.changed_data and share_form.initial.get('shared_with_username'):
+                changed_usernames.add(share_form.initial['shared_with_username'])
+        bump_list_versions(changed_usernames)
+
+    def delete_model(self, request, obj):
+        # Through delete_files so blobs are queued, storage is released and lists change
+        delete_files([obj.id])
+
+    def delete_queryset(self, request, queryset):
+        delete_files(list(queryset.values_list('id', flat=True)))
     
     def get_share_count(self, obj):
-        return obj.shares.count()
+        return obj.share_count
     get_share_count.short_description = 'Shares'
+    get_share_count.admin_order_field = 'share_count'
 
 @admin.register(FileShare)
 class FileShareAdmin(admin.ModelAdmin):
@@ -28,6 +60,22 @@ class FileShareAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        changed_usernames = [obj.file.uploaded_by.username, obj.shared_with_username]
+        if change and 'shared_with_username' in form.changed_data:
+            changed_usernames.append(form.initial['shared_with_username'])
+        bump_list_versions(changed_usernames)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_list_versions([obj.file.uploaded_by.username, obj.shared_with_username])
+
+    def delete_queryset(self, request, queryset):
+        shares = list(queryset.values_list('shared_with_username', 'file__uploaded_by__username'))
+        super().delete_queryset(request, queryset)
+        bump_list_versions({username for share in shares for username in share})
+
 @admin.register(ShareableLink)
 class ShareableLinkAdmin(admin.ModelAdmin):
     list_display = ('file', 'token', 'expiration_time', 'created_by', 'created_at', 'is_expired')
@@ -36,7 +84,27 @@ class ShareableLinkAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bump_list_versions([obj.file.uploaded_by.username])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_list_versions([obj.file.uploaded_by.username])
+
+    def delete_queryset(self, request, queryset):
+        usernames = set(queryset.values_list('file__uploaded_by__username', flat=True))
+        super().delete_queryset(request, queryset)
+        bump_list_versions(usernames)
+
     def is_expired(self, obj):
         return obj.is_expired
     is_expired.boolean = True
     is_expired.short_description = 'Expired'
+
+@admin.register(StorageUsage)
+class StorageUsageAdmin(admin.ModelAdmin):
+    list_display = ('user', 'bytes_used', 'file_count', 'quota_bytes')
+    search_fields = ('user__username',)
+    readonly_fields = ('bytes_used', 'file_count')
+    ordering = ('-bytes_used',)
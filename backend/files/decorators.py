@@ -1,15 +1,15 @@
 from functools import wraps
 from rest_framework.response import Response
 from rest_framework import status
-from .models import File, FileShare, ShareableLink
-from django.utils import timezone
+from .access import file_access, get_file_with_access, share_permission_subquery
+from .models import File, FileShare, ShareableLink, UploadSession
 
 def is_file_present(view_func):
     @wraps(view_func)
     def wrapped(request, file_id, *args, **kwargs):
         try:
-            file = File.objects.get(id=file_id)
-            request.file = file
+            # The user's share of the file is resolved with it, for has_file_access
+            request.file, request.file_access = get_file_with_access(file_id, request.user)
             return view_func(request, file_id, *args, **kwargs)
         except File.DoesNotExist:
             return Response(
@@ -64,7 +64,7 @@ def is_file_not_already_shared(view_func):
 def has_file_access(required_permission=None):
     """
     Decorator to check if user has access to the file.
-    Assumes @is_file_present has already set request.file
+    Assumes @is_file_present or @is_link_token_valid has already set request.file_access
     If required_permission is None, any share type (VIEW/DOWNLOAD) is sufficient.
     If required_permission is specified (e.g., 'DOWNLOAD'), the share must match that permission.
     """
@@ -72,25 +72,20 @@ def has_file_access(required_permission=None):
         @wraps(view_func)
         def wrapped(request, *args, **kwargs):
 
-            file_id = request.file.id
+            access = request.file_access
             # If user is the owner, they have full access
-            if request.file.uploaded_by_id == request.user.id:
+            if access.is_owner:
                 return view_func(request, *args, **kwargs)
             
             # Check if file is shared with the user
-            share = FileShare.objects.filter(
-                file_id=file_id,
-                shared_with_username=request.user.username
-            ).first()
-            
-            if not share:
+            if access.share_permission is None:
                 return Response(
                     {'error': 'Access denied'},
                     status=status.HTTP_403_FORBIDDEN
                 )
             
             # If required_permission is specified, check if user has that permission
-            if required_permission and share.permission_type != required_permission:
+            if required_permission and access.share_permission != required_permission:
                 return Response(
                     {'error': f'{required_permission} permission required'},
                     status=status.HTTP_403_FORBIDDEN
@@ -112,7 +107,9 @@ def is_link_token_valid(view_func):
             )
             
         try:
-            link = ShareableLink.objects.get(token=token)
+            link = ShareableLink.objects.select_related('file').annotate(
+                share_permission=share_permission_subquery(request.user, 'file_id')
+            ).get(token=token)
             
             # Use the model's is_expired property
             if link.is_expired:
@@ -122,6 +119,7 @@ def is_link_token_valid(view_func):
                 )
                 
             request.file = link.file  # Set the file for subsequent decorators
+            request.file_access = file_access(link.file, request.user, link.share_permission)
             return view_func(request, *args, **kwargs)
             
         except ShareableLink.DoesNotExist:
@@ -130,4 +128,23 @@ def is_link_token_valid(view_func):
                 status=status.HTTP_404_NOT_FOUND
             )
             
-    return wrapped 
\ No newline at end of file
+    return wrapped 
+
+def is_upload_session_present(view_func):
+    @wraps(view_func)
+    def wrapped(request, upload_id, *args, **kwargs):
+        try:
+            upload_session = UploadSession.objects.get(id=upload_id, created_by_id=request.user.id)
+        except UploadSession.DoesNotExist:
+            return Response(
+                {'error': 'Upload session not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if upload_session.is_expired:
+            return Response(
+                {'error': 'Upload session has expired'},
+                status=status.HTTP_410_GONE
+            )
+        request.upload_session = upload_session
+        return view_func(request, upload_id, *args, **kwargs)
+    return wrapped
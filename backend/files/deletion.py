@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from .models import File, FileShare, PendingBlobDeletion, ShareableLink, UploadSession
+from .quotas import release_storage
+from .storage import remove_blob
+from .versions import bump_list_versions
+
+
+def delete_files(file_ids):
+    """
+    Delete files with their shares and links in batches, queueing their
+    blobs for the reclaimer instead of unlinking them inline.
+    Returns the number of deleted files.
+    """
+    deleted = 0
+    batch_size = settings.DELETE_BATCH_SIZE
+    for start in range(0, len(file_ids), batch_size):
+        batch = file_ids[start:start + batch_size]
+        with transaction.atomic():
+            queue_blob_deletions(File.objects.filter(id__in=batch).values_list('file_path', flat=True))
+            totals = File.objects.filter(id__in=batch).values('uploaded_by_id', 'uploaded_by__username').annotate(
+                size=Sum('size'),
+                count=Count('id')
+            )
+            changed_usernames = set()
+            for total in totals:
+                release_storage(total['uploaded_by_id'], total['size'], total['count'])
+                changed_usernames.add(total['uploaded_by__username'])
+            changed_usernames.update(
+                FileShare.objects.filter(file_id__in=batch).values_list('shared_with_username', flat=True).order_by().distinct()
+            )
+            bump_list_versions(changed_usernames)
+            # One DELETE per table instead of Django's collector, which loads the rows and deletes
+            # them 100 at a time. It also skips the shares' post_delete invalidation, which is not
+            # needed: file ids are not reused, so their cached permissions can't match again.
+            for dependents in (FileShare.objects.filter(file_id__in=batch), ShareableLink.objects.filter(file_id__in=batch)):
+                dependents._raw_delete(dependents.db)
+            files = File.objects.filter(id__in=batch)
+            deleted += files._raw_delete(files.db)
+    return deleted
+
+
+def queue_blob_deletions(file_paths):
+    """
+    Queue the paths of a flat values_list() queryset in one INSERT ... SELECT,
+    bulk_create would need a round trip through Python and one INSERT per few hundred rows
+    """
+    select_sql, params = file_paths.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {PendingBlobDeletion._meta.db_table} (file_path, created_at) '
+            f'SELECT paths.*, %s FROM ({select_sql}) paths',
+            [connection.ops.adapt_datetimefield_value(timezone.now()), *params]
+        )
+
+
+def expire_upload_sessions():
+    """Drop expired upload sessions, queueing their staging files"""
+    with transaction.atomic():
+        expired = UploadSession.objects.filter(expiration_time__lt=timezone.now())
+        queue_blob_deletions(expired.values_list('staging_path', flat=True))
+        _, counts = expired.delete()
+    return counts.get(UploadSession._meta.label, 0)
+
+
+def reclaim_pending_blobs(batch_size):
+    """Unlink one batch of queued blobs. Returns how many were reclaimed."""
+    pending = list(PendingBlobDeletion.objects.all()[:batch_size])
+    for blob in pending:
+        remove_blob(blob.file_path)
+    PendingBlobDeletion.objects.filter(id__in=[blob.id for blob in pending]).delete()
+    return len(pending)
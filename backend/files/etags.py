@@ -0,0 +1,41 @@
+import hashlib
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+
+
+def file_etag(file, variant=None):
+    """
+    Strong ETag derived from the blob's SHA-256 and the metadata sent along with it
+    (name, encrypted key and owner), so renames and key rotations change it too.
+    `variant` distinguishes representations of the same blob (e.g. JSON vs raw bytes).
+    Files uploaded before digests were recorded have no ETag.
+    """
+    if not file.sha256:
+        return None
+    metadata = '\0'.join([file.file_name, file.encrypted_key, file.uploaded_by.username])
+    tag = f'{file.sha256}-{hashlib.sha256(metadata.encode()).hexdigest()[:16]}'
+    if variant:
+        return f'"{tag}-{variant}"'
+    return f'"{tag}"'
+
+
+def etag_matches(request, etag):
+    """Weak comparison of `etag` against the request's If-None-Match header"""
+    if_none_match = request.headers.get('If-None-Match')
+    if not etag or not if_none_match:
+        return False
+    tags = parse_etags(if_none_match)
+    if tags == ['*']:
+        return True
+    return etag in [tag.removeprefix('W/') for tag in tags]
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def list_etag(user, version):
+    """ETag of a user's list endpoints, changes with their ListVersion"""
+    return f'"list-{user.id}-{version}"'
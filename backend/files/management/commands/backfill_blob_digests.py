@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from files.models import File
+from files.storage import hash_blob
+
+
+class Command(BaseCommand):
+    help = 'Record size and SHA-256 for files uploaded before digests were computed on upload.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        last_id = 0
+        updated = missing = 0
+
+        while True:
+            batch = list(
+                File.objects.filter(id__gt=last_id, sha256='')
+                .order_by('id')
+                .only('id', 'file_path')[:options['batch_size']]
+            )
+            if not batch:
+                break
+
+            for file in batch:
+                try:
+                    file.size, file.sha256 = hash_blob(file.file_path)
+                except FileNotFoundError:
+                    missing += 1
+                    self.stderr.write(f'Blob missing for file {file.id}: {file.file_path}')
+                    continue
+                updated += 1
+            File.objects.bulk_update([file for file in batch if file.sha256], ['size', 'sha256'])
+            last_id = batch[-1].id
+
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated}, missing {missing}'))
@@ -0,0 +1,88 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from files.models import File, FileShare
+from files.serializers import (
+    FileSerializer, FileShareSerializer, SharedFileSerializer,
+    FILE_LIST_FIELDS, FILE_SHARE_LIST_FIELDS, SHARED_FILE_LIST_FIELDS,
+    serialize_file_rows, serialize_file_share_rows, serialize_shared_file_rows
+)
+from users.constants import DEFAULT_ROLE
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare rows/sec of the ModelSerializer and values() list serializers. '
+        'Fixture rows are created in a transaction that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['rows'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, rows, repeat):
+        owner = User.objects.create_user('benchmark-owner', 'Benchmark!123', DEFAULT_ROLE)
+        recipient = User.objects.create_user('benchmark-recipient', 'Benchmark!123', DEFAULT_ROLE)
+        files = File.objects.bulk_create(
+            File(file_name=f'file-{i}.bin', file_path='benchmark', encrypted_key='key', uploaded_by=owner)
+            for i in range(rows)
+        )
+        FileShare.objects.bulk_create(
+            FileShare(file=file, shared_with_username=recipient.username, shared_by=owner)
+            for file in files
+        )
+
+        cases = [
+            (
+                'list_files',
+                lambda: FileSerializer(File.objects.filter(uploaded_by=owner), many=True).data,
+                lambda: serialize_file_rows(File.objects.filter(uploaded_by_id=owner.id).values(*FILE_LIST_FIELDS)),
+            ),
+            (
+                'list_file_shares',
+                lambda: FileShareSerializer(FileShare.objects.filter(shared_by=owner), many=True).data,
+                lambda: serialize_file_share_rows(
+                    FileShare.objects.filter(shared_by=owner).values(*FILE_SHARE_LIST_FIELDS)
+                ),
+            ),
+            (
+                'list_my_shares',
+                lambda: SharedFileSerializer(
+                    FileShare.objects.filter(shared_with_username=recipient.username)
+                    .select_related('file', 'file__uploaded_by', 'shared_by'),
+                    many=True
+                ).data,
+                lambda: serialize_shared_file_rows(
+                    FileShare.objects.filter(shared_with_username=recipient.username).values(*SHARED_FILE_LIST_FIELDS)
+                ),
+            ),
+        ]
+
+        for name, model_path, fast_path in cases:
+            model_rate = self.rows_per_second(model_path, rows, repeat)
+            fast_rate = self.rows_per_second(fast_path, rows, repeat)
+            self.stdout.write(
+                f'{name}: ModelSerializer {model_rate:,.0f} rows/s, '
+                f'values() {fast_rate:,.0f} rows/s ({fast_rate / model_rate:.1f}x)'
+            )
+
+    def rows_per_second(self, serialize, rows, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            serialize()
+            best = min(best, time.perf_counter() - started)
+        return rows / best
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from files.deletion import expire_upload_sessions, reclaim_pending_blobs
+
+
+class Command(BaseCommand):
+    help = 'Unlink blobs of deleted files and expired upload sessions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new work')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_upload_sessions()
+            reclaimed = 0
+            while True:
+                count = reclaim_pending_blobs(options['batch_size'])
+                reclaimed += count
+                if count < options['batch_size']:
+                    break
+            if reclaimed or expired:
+                self.stdout.write(f'Reclaimed {reclaimed} blobs, expired {expired} upload sessions')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
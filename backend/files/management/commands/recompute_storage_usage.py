@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from files.quotas import rebuild_storage_usage
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild per-user storage usage from File sizes. '
+        'Run backfill_blob_digests first so older files have a size.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            owners = rebuild_storage_usage()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed usage for {owners} users'))
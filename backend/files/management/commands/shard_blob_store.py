@@ -0,0 +1,94 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from files.models import File
+from files.storage import blob_full_path, sharded_blob_path
+
+
+class Command(BaseCommand):
+    help = (
+        'Move blobs from the flat encrypted_files/ layout into the hash-prefixed fan-out layout '
+        'and rewrite File.file_path. Safe to run while the app is serving and to re-run after an interruption.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+        parser.add_argument('--start-id', type=int, default=0, help='Resume after this File id')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        last_id = options['start_id']
+        moved = skipped = missing = changed = 0
+
+        while True:
+            batch = list(
+                File.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'file_path')[:options['batch_size']]
+            )
+            if not batch:
+                break
+
+            for file_id, file_path in batch:
+                target_path = sharded_blob_path(os.path.basename(file_path))
+                if file_path == target_path:
+                    skipped += 1
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(f'{file_path} -> {target_path}')
+                    moved += 1
+                    continue
+                if not os.path.exists(blob_full_path(file_path)) and not os.path.exists(blob_full_path(target_path)):
+                    missing += 1
+                    self.stderr.write(f'Blob missing for file {file_id}: {file_path}')
+                elif self.move_blob(file_id, file_path, target_path):
+                    moved += 1
+                else:
+                    # Picked up again by the next run if the row still exists
+                    changed += 1
+                    self.stderr.write(f'File {file_id} was deleted or moved meanwhile, skipped')
+
+            last_id = batch[-1][0]
+            self.stdout.write(f'Processed files up to id {last_id}')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved}, already sharded {skipped}, missing {missing}, changed meanwhile {changed}'
+        ))
+
+    def move_blob(self, file_id, file_path, target_path):
+        """
+        Link the blob at its new path, point the row at it, then drop the old name,
+        so concurrent downloads always find the blob under the path they read.
+        Returns False, with the blob left under its old path, if the row was
+        deleted or pointed elsewhere since it was read.
+        """
+        source = blob_full_path(file_path)
+        target = blob_full_path(target_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        if os.path.exists(source):
+            try:
+                os.link(source, target)
+            except FileExistsError:
+                # Left over from an interrupted run
+                pass
+            except OSError:
+                # Hard links unsupported on this filesystem
+                os.replace(source, target)
+        elif not os.path.exists(target):
+            return False
+
+        if not File.objects.filter(id=file_id, file_path=file_path).update(file_path=target_path):
+            # Unless another run already moved it there
+            if not File.objects.filter(file_path=target_path).exists():
+                if os.path.exists(source):
+                    os.remove(target)
+                else:
+                    os.replace(target, source)
+            return False
+        if os.path.exists(source):
+            os.remove(source)
+        return True
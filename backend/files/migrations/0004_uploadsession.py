@@ -0,0 +1,57 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:05
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_shareablelink'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(max_length=255)),
+                ('encrypted_key', models.TextField()),
+                ('total_size', models.BigIntegerField()),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('staging_path', models.CharField(max_length=512)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expiration_time', models.DateTimeField()),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'upload_sessions',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='files.uploadsession')),
+            ],
+            options={
+                'db_table': 'upload_chunks',
+                'ordering': ['index'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='uploadsession',
+            index=models.Index(fields=['created_by', 'created_at'], name='upload_sess_created_d668f9_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='uploadchunk',
+            unique_together={('session', 'index')},
+        ),
+    ]
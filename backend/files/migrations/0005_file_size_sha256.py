@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='size',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
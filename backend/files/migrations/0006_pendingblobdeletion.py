@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0005_file_size_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingBlobDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(max_length=512)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'pending_blob_deletions',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0006_pendingblobdeletion'),
+        ('users', '0002_remove_user_is_staff'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='storage_usage', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('bytes_used', models.BigIntegerField(default=0)),
+                ('file_count', models.IntegerField(default=0)),
+                ('quota_bytes', models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'storage_usage',
+            },
+        ),
+    ]
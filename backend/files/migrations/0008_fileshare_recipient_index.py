@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_storageusage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fileshare',
+            index=models.Index(fields=['shared_with_username', 'created_at', 'id'], name='file_shares_shared__1b5676_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Full-text index over File.file_name, SQLite only. Other backends search with LIKE.
+
+from django.db import migrations, OperationalError
+
+CREATE_FTS = [
+    "CREATE VIRTUAL TABLE files_fts USING fts5(file_name, content='files', content_rowid='id', tokenize='trigram')",
+    """CREATE TRIGGER files_fts_insert AFTER INSERT ON files BEGIN
+        INSERT INTO files_fts(rowid, file_name) VALUES (new.id, new.file_name);
+    END""",
+    """CREATE TRIGGER files_fts_delete AFTER DELETE ON files BEGIN
+        INSERT INTO files_fts(files_fts, rowid, file_name) VALUES ('delete', old.id, old.file_name);
+    END""",
+    """CREATE TRIGGER files_fts_update AFTER UPDATE OF file_name ON files BEGIN
+        INSERT INTO files_fts(files_fts, rowid, file_name) VALUES ('delete', old.id, old.file_name);
+        INSERT INTO files_fts(rowid, file_name) VALUES (new.id, new.file_name);
+    END""",
+    "INSERT INTO files_fts(files_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS files_fts_insert",
+    "DROP TRIGGER IF EXISTS files_fts_delete",
+    "DROP TRIGGER IF EXISTS files_fts_update",
+    "DROP TABLE IF EXISTS files_fts",
+]
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(CREATE_FTS[0])
+    except OperationalError:
+        # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer)
+        return
+    for statement in CREATE_FTS[1:]:
+        schema_editor.execute(statement)
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_FTS:
+        schema_editor.execute(statement)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0008_fileshare_recipient_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
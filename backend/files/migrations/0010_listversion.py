@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0009_files_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListVersion',
+            fields=[
+                ('username', models.CharField(max_length=150, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'list_versions',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+from files.quotas import rebuild_storage_usage
+
+
+def backfill_storage_usage(apps, schema_editor):
+    """
+    Count every owner's existing files, so quotas and file counts cover files that
+    predate them. Files stored before sizes were recorded count 0 bytes until
+    `manage.py backfill_blob_digests` sizes them in batches and
+    `manage.py recompute_storage_usage` is run again, reading every blob has no
+    place in a schema migration.
+    """
+    rebuild_storage_usage(apps.get_model('files', 'File'), apps.get_model('files', 'StorageUsage'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0010_listversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_storage_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0011_backfill_storage_usage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fileshare',
+            name='shared_with_username',
+            field=models.CharField(max_length=150),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from users.models import User
 from django.utils import timezone
+import math
 import uuid
 from users.constants import PERM_VIEW, PERMISSION_CHOICES
 
@@ -13,6 +14,8 @@ class File(models.Model):
         related_name='uploaded_files'
     )
     encrypted_key = models.TextField()  # Stores the encrypted AES key
+    size = models.BigIntegerField(default=0)  # Size of the encrypted blob in bytes
+    sha256 = models.CharField(max_length=64, blank=True)  # Hex digest of the encrypted blob
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
@@ -32,9 +35,9 @@ class FileShare(models.Model):
         on_delete=models.CASCADE,
         related_name='shares'
     )
+    # Lookups by recipient use the leading column of the (shared_with_username, created_at, id) index
     shared_with_username = models.CharField(
-        max_length=150,  # Match User model username max_length
-        db_index=True  # Add index for better query performance
+        max_length=150  # Match User model username max_length
     )
     shared_by = models.ForeignKey(
         User,
@@ -54,6 +57,10 @@ class FileShare(models.Model):
         unique_together = ['file', 'shared_with_username']
         # Order by most recent first
         ordering = ['-created_at']
+        indexes = [
+            # Serves the paginated "shared with me" list as an index range scan, without a sort
+            models.Index(fields=['shared_with_username', 'created_at', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.file.file_name} shared with {self.shared_with_username}"
@@ -97,3 +104,101 @@ class ShareableLink(models.Model):
         if self.expiration_time is None:
             return False
         return timezone.now() > self.expiration_time
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255)
+    encrypted_key = models.TextField()
+    total_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    staging_path = models.CharField(max_length=512)  # Partially written blob, chunks land at their offsets
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    expiration_time = models.DateTimeField()
+
+    class Meta:
+        db_table = 'upload_sessions'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_by', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Upload of {self.file_name} by {self.created_by.username}"
+
+    @property
+    def total_chunks(self):
+        return math.ceil(self.total_size / self.chunk_size)
+
+    @property
+    def is_expired(self):
+        return timezone.now() > self.expiration_time
+
+    def chunk_bounds(self, index):
+        """Return the (offset, length) of chunk `index` within the blob"""
+        offset = index * self.chunk_size
+        return offset, min(self.chunk_size, self.total_size - offset)
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(
+        'UploadSession',
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+    index = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'upload_chunks'
+        # A chunk is recorded once, re-sending it just overwrites the bytes
+        unique_together = ['session', 'index']
+        ordering = ['index']
+
+class PendingBlobDeletion(models.Model):
+    """Blob of a deleted File, unlinked later by the reclaim_blobs command"""
+    file_path = models.CharField(max_length=512)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'pending_blob_deletions'
+        ordering = ['id']
+
+    def __str__(self):
+        return self.file_path
+
+class StorageUsage(models.Model):
+    """Running totals of a user's stored blobs, kept current with F() updates"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='storage_usage'
+    )
+    bytes_used = models.BigIntegerField(default=0)
+    file_count = models.IntegerField(default=0)
+    quota_bytes = models.BigIntegerField(null=True, blank=True)  # None falls back to DEFAULT_STORAGE_QUOTA_BYTES
+
+    class Meta:
+        db_table = 'storage_usage'
+
+    def __str__(self):
+        return f"{self.user.username}: {self.bytes_used} bytes in {self.file_count} files"
+
+class ListVersion(models.Model):
+    """
+    Counter bumped whenever a user's files, shares or links change. Keyed by
+    username so recipients of a share are covered, it serves as the ETag of
+    the list endpoints.
+    """
+    username = models.CharField(max_length=150, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'list_versions'
+
+    def __str__(self):
+        return f"{self.username}: {self.version}"
@@ -0,0 +1,69 @@
+import base64
+import json
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def is_paginated(request):
+    """Lists stay unpaginated for clients that don't ask for a page"""
+    return 'cursor' in request.query_params or 'page_size' in request.query_params
+
+
+def get_page_size(request):
+    try:
+        page_size = int(request.query_params.get('page_size', settings.LIST_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.LIST_PAGE_SIZE
+    return min(max(page_size, 1), settings.LIST_MAX_PAGE_SIZE)
+
+
+def encode_cursor(created_at, pk):
+    payload = json.dumps([created_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk = json.loads(payload)
+        created_at = parse_datetime(created_at)
+    except (ValueError, TypeError):
+        raise InvalidCursor
+    if created_at is None or not isinstance(pk, int):
+        raise InvalidCursor
+    return created_at, pk
+
+
+def paginate_keyset(queryset, request):
+    """
+    Newest-first keyset pagination on (created_at, id) with opaque cursors,
+    so every page is an index range scan no matter how deep it is.
+    Works on model and values() querysets, the latter must include created_at and id.
+    Returns (rows, next_cursor). Raises InvalidCursor.
+    """
+    return keyset_page(queryset, get_page_size(request), request.query_params.get('cursor'))
+
+
+def keyset_page(queryset, page_size, cursor=None):
+    """One page of `queryset` after `cursor`, see paginate_keyset"""
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        # The plain created_at bound lets the index seek to the cursor, the OR only breaks ties
+        queryset = queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(id__lt=pk))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(last['created_at'], last['id'])
+        else:
+            next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db.models import Count, F, Q, Sum
+from .models import File, StorageUsage
+
+
+def effective_quota(usage):
+    if usage.quota_bytes is not None:
+        return usage.quota_bytes
+    return settings.DEFAULT_STORAGE_QUOTA_BYTES
+
+
+def get_usage(user_id):
+    usage, _ = StorageUsage.objects.get_or_create(user_id=user_id)
+    return usage
+
+
+def has_room_for(user_id, size):
+    """Cheap pre-check, done before any bytes of an upload are written"""
+    usage = get_usage(user_id)
+    quota = effective_quota(usage)
+    return quota is None or usage.bytes_used + size <= quota
+
+
+def room_left(user_id):
+    """Bytes the user can still store, None without a quota"""
+    usage = get_usage(user_id)
+    quota = effective_quota(usage)
+    return None if quota is None else max(quota - usage.bytes_used, 0)
+
+
+def reserve_storage(user_id, size, count=1):
+    """
+    Atomically add `size` bytes and `count` files to the user's usage,
+    unless that would exceed their quota. Returns False if over quota.
+    """
+    within_quota = Q(bytes_used__lte=F('quota_bytes') - size)
+    if settings.DEFAULT_STORAGE_QUOTA_BYTES is None:
+        within_quota |= Q(quota_bytes__isnull=True)
+    else:
+        within_quota |= Q(quota_bytes__isnull=True, bytes_used__lte=settings.DEFAULT_STORAGE_QUOTA_BYTES - size)
+
+    for _ in range(2):
+        updated = StorageUsage.objects.filter(within_quota, user_id=user_id).update(
+            bytes_used=F('bytes_used') + size,
+            file_count=F('file_count') + count
+        )
+        if updated:
+            return True
+        _, created = StorageUsage.objects.get_or_create(user_id=user_id)
+        if not created:
+            return False
+    return False
+
+
+def release_storage(user_id, size, count=1):
+    StorageUsage.objects.filter(user_id=user_id).update(
+        bytes_used=F('bytes_used') - size,
+        file_count=F('file_count') - count
+    )
+
+
+def rebuild_storage_usage(file_model=File, usage_model=StorageUsage):
+    """
+    Recompute every user's usage from the recorded File sizes, call it in a transaction.
+    Takes the models so data migrations can pass their historical ones.
+    Returns the number of users owning files.
+    """
+    totals = file_model.objects.values('uploaded_by_id').annotate(bytes_used=Sum('size'), file_count=Count('id'))
+    usage_model.objects.update(bytes_used=0, file_count=0)
+    for total in totals:
+        usage_model.objects.update_or_create(
+            user_id=total['uploaded_by_id'],
+            defaults={'bytes_used': total['bytes_used'] or 0, 'file_count': total['file_count']}
+        )
+    return len(totals)
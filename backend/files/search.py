@@ -0,0 +1,57 @@
+from functools import lru_cache
+from django.db import connection
+from django.db.models import Q
+from .models import File, FileShare
+
+FTS_TABLE = 'files_fts'
+# The trigram tokenizer can't match anything shorter than this
+FTS_MIN_QUERY_LENGTH = 3
+
+
+@lru_cache(maxsize=None)
+def fts_available():
+    return connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+
+
+def visible_files_filter(user):
+    shared_with_me = FileShare.objects.filter(shared_with_username=user.username).values('file_id')
+    return Q(uploaded_by_id=user.id) | Q(id__in=shared_with_me)
+
+
+def search_files(user, query, page, page_size):
+    """
+    Search the names of files the user owns or that are shared with them.
+    Ranked by BM25 when the SQLite FTS5 index is available, by recency otherwise.
+    Returns (files, has_more).
+    """
+    offset = (page - 1) * page_size
+    if fts_available() and len(query) >= FTS_MIN_QUERY_LENGTH:
+        file_ids = ranked_file_ids(user, query, page_size + 1, offset)
+        files = File.objects.select_related('uploaded_by').in_bulk(file_ids)
+        results = [files[file_id] for file_id in file_ids if file_id in files]
+    else:
+        results = list(
+            File.objects.filter(visible_files_filter(user), file_name__icontains=query)
+            .select_related('uploaded_by')
+            .order_by('-created_at', '-id')[offset:offset + page_size + 1]
+        )
+    return results[:page_size], len(results) > page_size
+
+
+def ranked_file_ids(user, query, limit, offset):
+    # Quote the query as one FTS5 string so it is matched as a substring, not parsed as syntax
+    match = '"' + query.replace('"', '""') + '"'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT files.id FROM {FTS_TABLE}
+            JOIN files ON files.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s
+              AND (files.uploaded_by_id = %s
+                   OR files.id IN (SELECT file_id FROM file_shares WHERE shared_with_username = %s))
+            ORDER BY bm25({FTS_TABLE}), files.id DESC
+            LIMIT %s OFFSET %s
+            """,
+            [match, user.id, user.username, limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
@@ -1,5 +1,6 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import File, FileShare
+from .models import File, FileShare, UploadSession
 from utils.sanitize import sanitize_input
 from users.constants import PERM_VIEW, PERM_DOWNLOAD
 
@@ -23,6 +24,38 @@ class FileUploadSerializer(serializers.ModelSerializer):
         # Sanitize filename - allow spaces
         return sanitize_input(value, allow_spaces=True)
 
+class UploadSessionCreateSerializer(serializers.ModelSerializer):
+    encrypted_key = serializers.CharField(write_only=True)
+    total_size = serializers.IntegerField(min_value=1)
+    chunk_size = serializers.IntegerField(min_value=1, required=False)
+
+    class Meta:
+        model = UploadSession
+        fields = ('file_name', 'encrypted_key', 'total_size', 'chunk_size')
+
+    def validate_file_name(self, value):
+        # Sanitize filename - allow spaces
+        return sanitize_input(value, allow_spaces=True)
+
+    def validate_total_size(self, value):
+        if value > settings.UPLOAD_SESSION_MAX_SIZE:
+            raise serializers.ValidationError("File is too large.")
+        return value
+
+    def validate_chunk_size(self, value):
+        if value > settings.UPLOAD_CHUNK_MAX_SIZE:
+            raise serializers.ValidationError("Chunk size is too large.")
+        return value
+
+class FileIdListSerializer(serializers.Serializer):
+    file_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+
+    def validate_file_ids(self, value):
+        value = list(dict.fromkeys(value))
+        if len(value) > settings.BULK_MAX_FILES:
+            raise serializers.ValidationError(f"At most {settings.BULK_MAX_FILES} files can be requested at once.")
+        return value
+
 class FileShareSerializer(serializers.ModelSerializer):
     file_name = serializers.CharField(source='file.file_name', read_only=True)
     
@@ -63,4 +96,61 @@ class SharedFileSerializer(serializers.ModelSerializer):
             'shared_by_username',
             'permission_type',
             'created_at'
-        ]
\ No newline at end of file
+        ]
+
+# Fast paths for the hot list endpoints. They produce the same output as
+# FileSerializer, FileShareSerializer and SharedFileSerializer, but read only
+# the listed columns with values() and build the dicts directly.
+
+FILE_LIST_FIELDS = ('id', 'file_name', 'created_at', 'uploaded_by__username')
+FILE_SHARE_LIST_FIELDS = ('id', 'file__file_name', 'shared_with_username', 'permission_type', 'created_at')
+SHARED_FILE_LIST_FIELDS = (
+    'id',
+    'file_id',
+    'file__file_name',
+    'file__uploaded_by__username',
+    'shared_by__username',
+    'permission_type',
+    'file__created_at',
+    'created_at',  # Keyset pagination cursor
+)
+
+def serialize_file_rows(rows):
+    to_datetime = serializers.DateTimeField().to_representation
+    return [
+        {
+            'id': row['id'],
+            'file_name': row['file_name'],
+            'created_at': to_datetime(row['created_at']),
+            'uploaded_by_username': row['uploaded_by__username'],
+        }
+        for row in rows
+    ]
+
+def serialize_file_share_rows(rows):
+    to_datetime = serializers.DateTimeField().to_representation
+    return [
+        {
+            'id': row['id'],
+            'file_name': row['file__file_name'],
+            'shared_with_username': row['shared_with_username'],
+            'permission_type': row['permission_type'],
+            'created_at': to_datetime(row['created_at']),
+        }
+        for row in rows
+    ]
+
+def serialize_shared_file_rows(rows):
+    to_datetime = serializers.DateTimeField().to_representation
+    return [
+        {
+            'id': row['id'],
+            'file_id': row['file_id'],
+            'file_name': row['file__file_name'],
+            'uploaded_by_username': row['file__uploaded_by__username'],
+            'shared_by_username': row['shared_by__username'],
+            'permission_type': row['permission_type'],
+            'created_at': to_datetime(row['file__created_at']),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from users.models import User
+from .access import invalidate_share_permission
+from .deletion import queue_blob_deletions
+from .models import File, FileShare, UploadSession
+from .versions import bump_list_versions
+
+
+@receiver(pre_delete, sender=User)
+def queue_user_blobs(sender, instance, **kwargs):
+    # Files and upload sessions go away with the user through the cascade, keep their blobs reclaimable
+    queue_blob_deletions(File.objects.filter(uploaded_by_id=instance.id).values_list('file_path', flat=True))
+    queue_blob_deletions(UploadSession.objects.filter(created_by_id=instance.id).values_list('staging_path', flat=True))
+    # Recipients lose the shares of the user's files
+    bump_list_versions(
+        FileShare.objects.filter(file__uploaded_by_id=instance.id).values_list('shared_with_username', flat=True).order_by().distinct()
+    )
+
+
+# Also covers shares deleted by a cascade, e.g. with the user who shared them
+@receiver(post_save, sender=FileShare)
+@receiver(post_delete, sender=FileShare)
+def drop_cached_share_permission(sender, instance, **kwargs):
+    invalidate_share_permission(instance.file_id, instance.shared_with_username)
+
+
+@receiver(pre_save, sender=FileShare)
+def drop_cached_share_permission_of_previous_recipient(sender, instance, update_fields=None, **kwargs):
+    # An edit that moves the share to another user or file must also drop the old pair
+    if instance._state.adding or (update_fields is not None and not {'file', 'shared_with_username'} & set(update_fields)):
+        return
+    previous = FileShare.objects.filter(pk=instance.pk).values_list('file_id', 'shared_with_username').first()
+    if previous and previous != (instance.file_id, instance.shared_with_username):
+        invalidate_share_permission(*previous)
@@ -0,0 +1,50 @@
+import hashlib
+import os
+import uuid
+from django.conf import settings
+
+
+def blob_full_path(file_path):
+    """Absolute path of a blob stored as `file_path` (relative to BASE_DIR)"""
+    return os.path.join(settings.BASE_DIR, file_path)
+
+
+def sharded_blob_path(file_name):
+    """
+    Fan blobs out over hash-prefixed sub directories (e.g. encrypted_files/ab/cd/<name>)
+    so no single directory grows to millions of entries.
+    """
+    digest = hashlib.sha256(file_name.encode()).hexdigest()
+    prefixes = [digest[level * 2:level * 2 + 2] for level in range(settings.UPLOAD_DIR_FANOUT_DEPTH)]
+    return os.path.join(settings.UPLOAD_DIR, *prefixes, file_name)
+
+
+def new_blob_path(extension=''):
+    """Reserve a unique relative path for a new encrypted blob"""
+    file_path = sharded_blob_path(f"{uuid.uuid4()}{extension}")
+    os.makedirs(os.path.dirname(blob_full_path(file_path)), exist_ok=True)
+    return file_path
+
+
+def new_staging_path():
+    """Reserve a unique relative path for a partially uploaded blob"""
+    os.makedirs(blob_full_path(settings.UPLOAD_STAGING_DIR), exist_ok=True)
+    return os.path.join(settings.UPLOAD_STAGING_DIR, f"{uuid.uuid4()}.part")
+
+
+def hash_blob(file_path):
+    """Return the (size, sha256 hex digest) of a stored blob"""
+    hasher = hashlib.sha256()
+    size = 0
+    with open(blob_full_path(file_path), 'rb') as blob:
+        for chunk in iter(lambda: blob.read(settings.DOWNLOAD_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+            size += len(chunk)
+    return size, hasher.hexdigest()
+
+
+def remove_blob(file_path):
+    try:
+        os.remove(blob_full_path(file_path))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,300 @@
+import json
+import os
+import re
+import uuid
+import zipfile
+from urllib.parse import quote, unquote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+RANGE_SPEC_RE = re.compile(r'^(\d*)-(\d*)$')
+
+SERVE_BACKEND_DJANGO = 'django'
+SERVE_BACKEND_X_ACCEL_REDIRECT = 'x-accel-redirect'
+SERVE_BACKEND_X_SENDFILE = 'x-sendfile'
+SERVE_BACKEND_SENDFILE = 'sendfile'
+
+# Internal header telling ZeroCopyFileMiddleware which file region to send, never reaches the client
+ZERO_COPY_HEADER = 'X-Zero-Copy-File'
+ZERO_COPY_EXTENSION = 'http.response.zerocopysend'
+
+
+def parse_range_header(header, size):
+    """
+    Parse a `Range: bytes=...` header against a blob of `size` bytes.
+    Returns None if the header should be ignored (missing, malformed or too many ranges),
+    an empty list if no range is satisfiable, or a list of (start, end) inclusive offsets.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+
+    specs = [spec.strip() for spec in specs.split(',')]
+    if len(specs) > settings.DOWNLOAD_MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = RANGE_SPEC_RE.match(spec)
+        if not match or spec == '-':
+            return None
+        first, last = match.groups()
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0 or size == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = int(last) if last else size - 1
+        ranges.append((start, min(end, size - 1)))
+    return ranges
+
+
+def if_range_matches(request, last_modified, etag=None):
+    """
+    Evaluate `If-Range`. A range request is only honoured if the validator
+    still matches the current representation; otherwise the full blob is sent.
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Weak validators never match for If-Range
+        return etag is not None and if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def iter_file_range(path, start, length, chunk_size):
+    with open(path, 'rb') as blob:
+        blob.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = blob.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def iter_multipart_ranges(path, ranges, size, boundary, content_type, chunk_size):
+    for start, end in ranges:
+        yield part_header(boundary, content_type, start, end, size)
+        yield from iter_file_range(path, start, end - start + 1, chunk_size)
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode()
+
+
+def part_header(boundary, content_type, start, end, size):
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+    ).encode()
+
+
+def ranged_file_response(request, path, content_type='application/octet-stream', etag=None, filename=None):
+    """
+    Serve the file at `path`, honouring `Range`/`If-Range` with
+    206 Partial Content (single or multipart/byteranges) and 416 responses.
+    `filename` is the download name, the blob's own name is never sent.
+    Raises FileNotFoundError if the blob is missing.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    chunk_size = settings.DOWNLOAD_CHUNK_SIZE
+    ranges = requested_ranges(request, stat, etag)
+
+    if ranges is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response.block_size = chunk_size
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            iter_file_range(path, start, end - start + 1, chunk_size),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = uuid.uuid4().hex
+        content_length = sum(
+            len(part_header(boundary, content_type, start, end, size)) + (end - start + 1) + 2
+            for start, end in ranges
+        ) + len(f'--{boundary}--\r\n')
+        response = StreamingHttpResponse(
+            iter_multipart_ranges(path, ranges, size, boundary, content_type, chunk_size),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}'
+        )
+        response['Content-Length'] = str(content_length)
+
+    set_validator_headers(response, stat, etag)
+    set_download_name(response, filename)
+    return response
+
+
+def requested_ranges(request, stat, etag=None):
+    if request.method not in ('GET', 'HEAD') or not if_range_matches(request, stat.st_mtime, etag):
+        return None
+    return parse_range_header(request.headers.get('Range'), stat.st_size)
+
+
+def set_validator_headers(response, stat, etag=None):
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if etag:
+        response['ETag'] = etag
+
+
+def set_download_name(response, filename):
+    """Name the download `filename`, replacing the blob name FileResponse derives from the path"""
+    if filename and response.status_code != 416:
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    elif 'Content-Disposition' in response:
+        del response['Content-Disposition']
+
+
+def offloaded_file_response(request, file_path, content_type='application/octet-stream', etag=None, filename=None):
+    """
+    Hand the byte copying for the blob stored at `file_path` to the configured
+    FILE_SERVE_BACKEND. Returns None when the request has to be served from Python.
+    Raises FileNotFoundError if the blob is missing.
+    """
+    backend = settings.FILE_SERVE_BACKEND
+    full_path = os.path.join(settings.BASE_DIR, file_path)
+    stat = os.stat(full_path)
+
+    if backend == SERVE_BACKEND_X_ACCEL_REDIRECT:
+        # nginx serves the internal location itself, including Range requests
+        response = HttpResponse(content_type=content_type)
+        internal_path = os.path.relpath(file_path, settings.UPLOAD_DIR).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = quote(settings.FILE_SERVE_INTERNAL_URL + internal_path)
+    elif backend == SERVE_BACKEND_X_SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    elif backend == SERVE_BACKEND_SENDFILE and ZERO_COPY_EXTENSION in getattr(request, 'scope', {}).get('extensions', {}):
+        ranges = requested_ranges(request, stat, etag)
+        if ranges is None:
+            offset, count = 0, stat.st_size
+            response = HttpResponse(content_type=content_type)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            offset, count = start, end - start + 1
+            response = HttpResponse(status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        else:
+            # Multi-range and unsatisfiable requests are rare, let Python build them
+            return None
+        response['Content-Length'] = str(count)
+        response[ZERO_COPY_HEADER] = f'{offset};{count};{quote(full_path)}'
+    else:
+        return None
+
+    set_validator_headers(response, stat, etag)
+    set_download_name(response, filename)
+    return response
+
+
+class ZeroCopyFileMiddleware:
+    """
+    ASGI middleware sending blobs marked with ZERO_COPY_HEADER through the
+    server's `http.response.zerocopysend` extension (os.sendfile) instead of
+    streaming them through Django.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or ZERO_COPY_EXTENSION not in scope.get('extensions', {}):
+            return await self.app(scope, receive, send)
+
+        zero_copy = None
+
+        async def send_wrapper(message):
+            nonlocal zero_copy
+            if message['type'] == 'http.response.start':
+                headers = []
+                for name, value in message['headers']:
+                    if name.decode('latin1').lower() == ZERO_COPY_HEADER.lower():
+                        offset, count, path = value.decode('latin1').split(';', 2)
+                        zero_copy = (int(offset), int(count), unquote(path))
+                    else:
+                        headers.append((name, value))
+                message = {**message, 'headers': headers}
+            elif message['type'] == 'http.response.body' and zero_copy is not None:
+                if message.get('more_body', False):
+                    return
+                if scope['method'] == 'HEAD':
+                    # Only the headers describing the region go out
+                    await send({'type': 'http.response.body', 'body': b''})
+                    return
+                offset, count, path = zero_copy
+                with open(path, 'rb') as blob:
+                    await send({
+                        'type': ZERO_COPY_EXTENSION,
+                        'file': blob,
+                        'offset': offset,
+                        'count': count
+                    })
+                return
+            await send(message)
+
+        return await self.app(scope, receive, send_wrapper)
+
+
+class ZipStreamBuffer:
+    """Write-only sink for zipfile whose contents are handed out as they are produced"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(entries, manifest, chunk_size):
+    """
+    Stream a ZIP (stored, no recompression) of `entries` - (arcname, path, date_time)
+    tuples - followed by `manifest` as manifest.json, without staging the archive.
+    """
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for arcname, path, date_time in entries:
+            info = zipfile.ZipInfo(arcname, date_time=date_time)
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = os.path.getsize(path)
+            with open(path, 'rb') as blob, archive.open(info, 'w') as entry:
+                for chunk in iter(lambda: blob.read(chunk_size), b''):
+                    entry.write(chunk)
+                    yield buffer.pop()
+            yield buffer.pop()
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+    yield buffer.pop()
@@ -1,3 +1,1370 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import importlib
+import io
+import json
+import os
+import zipfile
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import quote
+from django.apps import apps as django_apps
+from django.contrib.admin.sites import site as admin_site
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from users.constants import PERM_DOWNLOAD, PERM_VIEW, ROLE_ADMIN, ROLE_GUEST
+from utils.testing import ROW_COUNTS, QueryBudgetTestCase
+from .access import NOT_SHARED, cache_share_permission, cached_share_permission
+from .admin import FileAdmin
+from .etags import file_etag
+from .management.commands.shard_blob_store import Command as ShardBlobStoreCommand
+from .models import File, FileShare, ListVersion, PendingBlobDeletion, ShareableLink, StorageUsage, UploadChunk, UploadSession
+from .pagination import encode_cursor, keyset_page
+from .search import fts_available
+from .serializers import FILE_LIST_FIELDS, SHARED_FILE_LIST_FIELDS
+from .storage import blob_full_path, hash_blob, new_blob_path, new_staging_path, sharded_blob_path
+from .streaming import ZERO_COPY_EXTENSION, ZERO_COPY_HEADER, ZeroCopyFileMiddleware, offloaded_file_response, parse_range_header
 
-# Create your tests here.
+
+class FileTestCase(QueryBudgetTestCase):
+    """An owner and a recipient with their counter rows, and helpers to seed files"""
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user('owner')
+        self.recipient = self.create_user('recipient')
+        self.authenticate(self.owner)
+        # Budgets are for the steady state, once the per-user counter rows exist
+        StorageUsage.objects.bulk_create([StorageUsage(user=self.owner), StorageUsage(user=self.recipient)])
+        self.add_list_versions([self.owner.username, self.recipient.username])
+
+    def add_files(self, count, owner=None, share_with=None, permission=PERM_DOWNLOAD, with_blobs=False):
+        owner = owner or self.owner
+        files = File.objects.bulk_create(
+            File(
+                file_name=f'file-{index}.bin',
+                file_path=self.write_blob(b'encrypted') if with_blobs else 'encrypted_files/missing.bin',
+                encrypted_key='key',
+                size=9,
+                sha256='0' * 64,
+                uploaded_by=owner
+            )
+            for index in range(count)
+        )
+        if share_with:
+            self.share(files, share_with, permission)
+        return files
+
+    def add_list_versions(self, usernames):
+        ListVersion.objects.bulk_create([ListVersion(username=username) for username in usernames], ignore_conflicts=True)
+
+    def share(self, files, user, permission=PERM_DOWNLOAD):
+        FileShare.objects.bulk_create(
+            FileShare(file=file, shared_with_username=user.username, shared_by=file.uploaded_by, permission_type=permission)
+            for file in files
+        )
+
+    def add_shares_of(self, file, count):
+        """Share `file` with `count` more readers"""
+        start = FileShare.objects.filter(file=file).count()
+        usernames = [f'reader-{index}' for index in range(start, start + count)]
+        FileShare.objects.bulk_create(
+            FileShare(file=file, shared_with_username=username, shared_by=file.uploaded_by) for username in usernames
+        )
+        self.add_list_versions(usernames)
+
+    def write_blob(self, content):
+        file_path = new_blob_path('.bin')
+        with open(blob_full_path(file_path), 'wb') as blob:
+            blob.write(content)
+        return file_path
+
+    def create_upload_session(self, total_size, received_chunks=0):
+        staging_path = new_staging_path()
+        with open(blob_full_path(staging_path), 'wb') as staging:
+            staging.truncate(total_size)
+        upload_session = UploadSession.objects.create(
+            file_name='upload.bin',
+            encrypted_key='key',
+            total_size=total_size,
+            chunk_size=1,
+            staging_path=staging_path,
+            created_by=self.owner,
+            expiration_time=timezone.now() + timedelta(hours=1)
+        )
+        UploadChunk.objects.bulk_create(
+            UploadChunk(session=upload_session, index=index) for index in range(received_chunks)
+        )
+        return upload_session
+
+    def stored_files(self):
+        """Blobs and parts under the upload directory, relative to it"""
+        root = blob_full_path('encrypted_files')
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), root)
+            for directory, _, names in os.walk(root) for name in names
+        )
+
+    def upload_batch(self, contents):
+        return self.client.post('/files/upload/batch', {
+            'file': [SimpleUploadedFile(f'{index}.bin', content) for index, content in enumerate(contents)],
+            'file_name': [f'{index}.bin' for index in range(len(contents))],
+            'encrypted_key': ['key'] * len(contents)
+        })
+
+
+class FileQueryBudgetTests(FileTestCase):
+    def test_list_files(self):
+        self.assertQueryBudget(
+            2,
+            lambda count: self.add_files(count),
+            lambda _: self.client.get('/files/list')
+        )
+
+    def test_list_files_page(self):
+        self.assertQueryBudget(
+            2,
+            lambda count: self.add_files(count),
+            lambda _: self.client.get('/files/list', {'page_size': 20})
+        )
+
+    def test_upload_file(self):
+        self.assertQueryBudget(
+            7,
+            lambda count: self.add_files(count),
+            lambda _: self.client.post('/files/upload', {
+                'file': SimpleUploadedFile('upload.bin', b'encrypted'),
+                'file_name': 'upload.bin',
+                'encrypted_key': 'key'
+            }),
+            status_code=201
+        )
+
+    def test_upload_files_batch(self):
+        self.assertQueryBudget(
+            7,
+            lambda count: self.add_files(count),
+            lambda _: self.client.post('/files/upload/batch', {
+                'file': [SimpleUploadedFile('a.bin', b'encrypted'), SimpleUploadedFile('b.bin', b'encrypted')],
+                'file_name': ['a.bin', 'b.bin'],
+                'encrypted_key': ['key', 'key']
+            }),
+            status_code=201
+        )
+
+    def test_get_storage_usage(self):
+        self.assertQueryBudget(
+            1,
+            lambda count: self.add_files(count),
+            lambda _: self.client.get('/files/usage')
+        )
+
+    def test_create_upload_session(self):
+        self.assertQueryBudget(
+            2,
+            lambda count: self.add_files(count),
+            lambda _: self.client.post('/files/uploads/create', {
+                'file_name': 'upload.bin',
+                'encrypted_key': 'key',
+                'total_size': 10
+            }, content_type='application/json'),
+            status_code=201
+        )
+
+    def test_get_upload_session(self):
+        self.assertQueryBudget(
+            2,
+            lambda count: self.create_upload_session(2000, received_chunks=count),
+            lambda upload_session: self.client.get(f'/files/uploads/{upload_session.id}')
+        )
+
+    def test_upload_chunk(self):
+        self.assertQueryBudget(
+            2,
+            lambda count: self.create_upload_session(2000, received_chunks=count),
+            lambda upload_session: self.client.put(
+                f'/files/uploads/{upload_session.id}/chunks/1999', b'x', content_type='application/octet-stream'
+            )
+        )
+
+    def test_commit_upload_session(self):
+        self.assertQueryBudget(
+            11,
+            lambda count: self.create_upload_session(count, received_chunks=count),
+            lambda upload_session: self.client.post(f'/files/uploads/{upload_session.id}/commit'),
+            status_code=201
+        )
+
+    def test_delete_upload_session(self):
+        self.assertQueryBudget(
+            3,
+            lambda count: self.create_upload_session(2000, received_chunks=count),
+            lambda upload_session: self.client.delete(f'/files/uploads/{upload_session.id}/delete')
+        )
+
+    def test_get_file_details(self):
+        file = self.add_files(1)[0]
+        self.assertQueryBudget(
+            1,
+            lambda count: self.add_shares_of(file, count),
+            lambda _: self.client.get(f'/files/{file.id}')
+        )
+
+    def test_download_file(self):
+        file = self.add_files(1, with_blobs=True)[0]
+        self.assertQueryBudget(
+            1,
+            lambda count: self.add_shares_of(file, count),
+            lambda _: self.client.post(f'/files/{file.id}/download')
+        )
+
+    def test_download_file_raw_as_recipient(self):
+        file = self.add_files(1, share_with=self.recipient, with_blobs=True)[0]
+        self.authenticate(self.recipient)
+        self.assertQueryBudget(
+            1,
+            lambda count: self.add_shares_of(file, count),
+            lambda _: self.client.get(f'/files/{file.id}/download/raw')
+        )
+
+    def test_download_files_zip(self):
+        # The archive holds every seeded file, authorized in one query
+        files = []
+
+        def seed(count):
+            files.extend(self.add_files(count, owner=self.recipient, share_with=self.owner, with_blobs=True))
+            return [file.id for file in files]
+
+        self.assertQueryBudget(
+            1,
+            seed,
+            lambda file_ids: self.client.post('/files/download/zip', {'file_ids': file_ids}, content_type='application/json')
+        )
+
+    def test_delete_file(self):
+        def seed(count):
+            file = self.add_files(1)[0]
+            self.add_shares_of(file, count)
+            return file
+
+        self.assertQueryBudget(
+            12,
+            seed,
+            lambda file: self.client.delete(f'/files/{file.id}/delete')
+        )
+
+    def test_delete_files_bulk(self):
+        rows = 0
+
+        def seed(count):
+            # Every request deletes all the rows so far, each file shared with its own reader
+            nonlocal rows
+            rows += count
+            files = self.add_files(rows)
+            usernames = [f'reader-{file.id}' for file in files]
+            FileShare.objects.bulk_create(
+                FileShare(file=file, shared_with_username=username, shared_by=self.owner) for file, username in zip(files, usernames)
+            )
+            self.add_list_versions(usernames)
+            return files
+
+        # Batches of DELETE_BATCH_SIZE files each repeat the same queries
+        with self.settings(DELETE_BATCH_SIZE=ROW_COUNTS[-1]):
+            self.assertQueryBudget(
+                12,
+                seed,
+                lambda files: self.client.post(
+                    '/files/delete', {'file_ids': [file.id for file in files]}, content_type='application/json'
+                )
+            )
+
+    def test_list_file_shares(self):
+        file = self.add_files(1)[0]
+        self.assertQueryBudget(
+            2,
+            lambda count: self.add_shares_of(file, count),
+            lambda _: self.client.get(f'/files/{file.id}/shares/list')
+        )
+
+    def test_add_share(self):
+        def seed(count):
+            file = self.add_files(1)[0]
+            self.add_shares_of(file, count)
+            return file
+
+        self.assertQueryBudget(
+            7,
+            seed,
+            lambda file: self.client.post(
+                f'/files/{file.id}/shares/add',
+                {'shared_with_username': self.recipient.username, 'permission_type': PERM_VIEW},
+                content_type='application/json'
+            ),
+            status_code=201
+        )
+
+    def test_update_share(self):
+        file = self.add_files(1, share_with=self.recipient)[0]
+        share = FileShare.objects.get(file=file, shared_with_username=self.recipient.username)
+        self.assertQueryBudget(
+            7,
+            lambda count: self.add_shares_of(file, count),
+            lambda _: self.client.put(
+                f'/files/{file.id}/shares/{share.id}', {'permission_type': PERM_VIEW}, content_type='application/json'
+            )
+        )
+
+    def test_delete_share(self):
+        def seed(count):
+            file = self.add_files(1, share_with=self.recipient)[0]
+            self.add_shares_of(file, count)
+            return FileShare.objects.get(file=file, shared_with_username=self.recipient.username)
+
+        self.assertQueryBudget(
+            7,
+            seed,
+            lambda share: self.client.delete(f'/files/{share.file_id}/shares/{share.id}/delete')
+        )
+
+    def test_get_file_permission_as_recipient(self):
+        file = self.add_files(1, share_with=self.recipient)[0]
+        self.authenticate(self.recipient)
+        self.assertQueryBudget(
+            1,
+            lambda count: self.add_shares_of(file, count),
+            lambda _: self.client.get(f'/files/{file.id}/permission')
+        )
+
+    def test_list_my_shares(self):
+        self.authenticate(self.recipient)
+        self.assertQueryBudget(
+            2,
+            lambda count: self.add_files(count, share_with=self.recipient),
+            lambda _: self.client.get('/files/shares/me')
+        )
+
+    def test_list_my_shares_page(self):
+        self.authenticate(self.recipient)
+        self.assertQueryBudget(
+            2,
+            lambda count: self.add_files(count, share_with=self.recipient),
+            lambda _: self.client.get('/files/shares/me', {'page_size': 20})
+        )
+
+    def test_search_files(self):
+        fts_available()
+        self.assertQueryBudget(
+            2,
+            lambda count: (self.add_files(count), self.add_files(count, owner=self.recipient, share_with=self.owner)),
+            lambda _: self.client.get('/files/search', {'q': 'file'})
+        )
+
+    def test_get_dashboard(self):
+        # The shared count is only queried when the first page doesn't end the list
+        self.add_files(2, owner=self.recipient, share_with=self.owner)
+        self.assertQueryBudget(
+            3,
+            lambda count: self.add_files(count),
+            lambda _: self.client.get('/files/dashboard')
+        )
+        self.assertQueryBudget(
+            4,
+            lambda count: (self.add_files(count), self.add_files(count, owner=self.recipient, share_with=self.owner)),
+            lambda _: self.client.get('/files/dashboard', {'page_size': 1})
+        )
+
+    def test_generate_link(self):
+        file = self.add_files(1)[0]
+        self.assertQueryBudget(
+            6,
+            lambda count: ShareableLink.objects.bulk_create(
+                ShareableLink(file=file, created_by=self.owner) for _ in range(count)
+            ),
+            lambda _: self.client.post(f'/files/{file.id}/links/generate', {}, content_type='application/json'),
+            status_code=201
+        )
+
+    def test_verify_link_as_recipient(self):
+        file = self.add_files(1, share_with=self.recipient)[0]
+        link = ShareableLink.objects.create(file=file, created_by=self.owner)
+        self.authenticate(self.recipient)
+        self.assertQueryBudget(
+            1,
+            lambda count: self.add_shares_of(file, count),
+            lambda _: self.client.post('/files/links/verify', {'token': link.token}, content_type='application/json')
+        )
+
+    def test_access_is_resolved_from_the_share(self):
+        viewable = self.add_files(1, share_with=self.recipient, permission=PERM_VIEW, with_blobs=True)[0]
+        private = self.add_files(1, with_blobs=True)[0]
+        self.authenticate(self.recipient)
+
+        response = self.client.get(f'/files/{viewable.id}/permission')
+        self.assertEqual(response.json(), {'is_owner': False, 'permission_type': PERM_VIEW})
+        self.assertEqual(self.client.get(f'/files/{viewable.id}').status_code, 200)
+        self.assertEqual(self.client.get(f'/files/{viewable.id}/download/raw').status_code, 403)
+        self.assertEqual(self.client.get(f'/files/{private.id}').status_code, 403)
+
+    def test_cached_permission_follows_share_changes(self):
+        file = self.add_files(1, share_with=self.recipient, permission=PERM_DOWNLOAD, with_blobs=True)[0]
+        self.authenticate(self.recipient)
+        self.assertEqual(self.client.get(f'/files/{file.id}/download/raw').status_code, 200)
+
+        share = FileShare.objects.get(file=file)
+        share.permission_type = PERM_VIEW
+        share.save()
+        self.assertEqual(self.client.get(f'/files/{file.id}/download/raw').status_code, 403)
+        self.assertEqual(self.client.get(f'/files/{file.id}').status_code, 200)
+
+        self.authenticate(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/files/{file.id}/shares/{share.id}/delete').status_code, 200)
+        self.authenticate(self.recipient)
+        self.assertEqual(self.client.get(f'/files/{file.id}').status_code, 403)
+
+    def test_cached_permission_follows_the_recipient(self):
+        file = self.add_files(1, share_with=self.recipient)[0]
+        reader = self.create_user('reader')
+        self.authenticate(self.recipient)
+        self.assertEqual(self.client.get(f'/files/{file.id}').status_code, 200)
+
+        share = FileShare.objects.get(file=file)
+        share.shared_with_username = reader.username
+        share.save()
+        self.assertEqual(self.client.get(f'/files/{file.id}').status_code, 403)
+        self.authenticate(reader)
+        self.assertEqual(self.client.get(f'/files/{file.id}').status_code, 200)
+
+    def test_cascaded_share_deletes_drop_cached_permissions(self):
+        file = self.add_files(1, with_blobs=True)[0]
+        sharer = self.create_user('sharer')
+        FileShare.objects.create(file=file, shared_with_username=self.recipient.username, shared_by=sharer)
+        self.authenticate(self.recipient)
+        self.assertEqual(self.client.get(f'/files/{file.id}').status_code, 200)
+
+        sharer.delete()
+        self.assertEqual(self.client.get(f'/files/{file.id}').status_code, 403)
+
+    @override_settings(FILE_PERMISSION_CACHE='default')
+    def test_shared_cache_ignores_permissions_read_before_a_revoke(self):
+        caches['default'].clear()
+        file = self.add_files(1, share_with=self.recipient)[0]
+        # Another process reads the share, then the revoke lands before it caches what it read
+        share_permission, generation = cached_share_permission(file.id, self.recipient.username)
+        self.assertIsNone(share_permission)
+        FileShare.objects.filter(file=file).delete()
+        cache_share_permission(file.id, self.recipient.username, PERM_DOWNLOAD, generation)
+
+        self.authenticate(self.recipient)
+        self.assertEqual(self.client.get(f'/files/{file.id}').status_code, 403)
+        # What was read after the revoke is cached
+        self.assertEqual(cached_share_permission(file.id, self.recipient.username)[0], NOT_SHARED)
+
+
+
+class RawDownloadTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.file = self.add_files(1, with_blobs=True)[0]
+        self.file.file_name = 'report final.pdf'
+        self.file.save()
+
+    def test_download_is_named_after_the_file(self):
+        for headers in ({}, {'HTTP_RANGE': 'bytes=0-3'}):
+            with self.subTest(headers=headers):
+                response = self.client.get(f'/files/{self.file.id}/download/raw', **headers)
+                self.assertIn(response.status_code, (200, 206))
+                self.assertEqual(response['Content-Disposition'], 'attachment; filename="report final.pdf"')
+                self.assertEqual(response['X-File-Name'], 'report%20final.pdf')
+                self.assertEqual(response['X-Encrypted-Key'], 'key')
+
+        response = self.client.get(f'/files/{self.file.id}/download/raw')
+        self.assertEqual(b''.join(response.streaming_content), b'encrypted')
+
+    def test_missing_blob_is_not_found(self):
+        os.remove(blob_full_path(self.file.file_path))
+        self.assertEqual(self.client.get(f'/files/{self.file.id}/download/raw').status_code, 404)
+
+
+class RangeRequestTests(FileTestCase):
+    """The seeded blobs hold b'encrypted'"""
+
+    def setUp(self):
+        super().setUp()
+        self.file = self.add_files(1, with_blobs=True)[0]
+        self.url = f'/files/{self.file.id}/download/raw'
+
+    def test_parse_range_header(self):
+        cases = {
+            None: None,
+            'bytes=0-3': [(0, 3)],
+            'bytes=5-': [(5, 8)],
+            'bytes=-3': [(6, 8)],
+            'bytes=-20': [(0, 8)],
+            'bytes=2-100': [(2, 8)],
+            'bytes=0-1, 4-5': [(0, 1), (4, 5)],
+            'bytes=9-': [],
+            'bytes=-0': [],
+            'bytes=3-1': None,
+            'bytes=-': None,
+            'items=0-3': None,
+            'bytes=a-b': None,
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(parse_range_header(header, 9), expected)
+        with self.settings(DOWNLOAD_MAX_RANGES=2):
+            self.assertIsNone(parse_range_header('bytes=0-0,2-2,4-4', 9))
+
+    def test_single_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/9')
+        self.assertEqual(response['Content-Length'], '3')
+        self.assertEqual(b''.join(response.streaming_content), b'cry')
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */9')
+
+    def test_multiple_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,-2')
+        self.assertEqual(response.status_code, 206)
+        content_type, _, boundary = response['Content-Type'].partition('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertEqual(body, (
+            f'--{boundary}\r\nContent-Type: application/octet-stream\r\nContent-Range: bytes 0-1/9\r\n\r\nen\r\n'
+            f'--{boundary}\r\nContent-Type: application/octet-stream\r\nContent-Range: bytes 7-8/9\r\n\r\ned\r\n'
+            f'--{boundary}--\r\n'
+        ).encode())
+
+    def test_if_range(self):
+        etag = file_etag(self.file)
+        last_modified = self.client.get(self.url)['Last-Modified']
+        for if_range, status_code in ((etag, 206), ('"stale"', 200), (f'W/{etag}', 200), (last_modified, 206),
+                                      ('Mon, 01 Jan 2001 00:00:00 GMT', 200)):
+            with self.subTest(if_range=if_range):
+                response = self.client.get(self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=if_range)
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual(b''.join(response.streaming_content), b'en' if status_code == 206 else b'encrypted')
+
+
+class UploadSessionTests(FileTestCase):
+    def create(self, total_size, chunk_size):
+        response = self.client.post('/files/uploads/create', {
+            'file_name': 'upload.bin', 'encrypted_key': 'key', 'total_size': total_size, 'chunk_size': chunk_size
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put_chunk(self, upload_id, index, data):
+        return self.client.put(f'/files/uploads/{upload_id}/chunks/{index}', data, content_type='application/octet-stream')
+
+    def test_chunks_sent_out_of_order_are_assembled(self):
+        content = b'0123456789abcdefghij!'
+        upload = self.create(len(content), 5)
+        self.assertEqual(upload['total_chunks'], 5)
+        for index in (4, 1, 3, 0):
+            self.assertEqual(self.put_chunk(upload['upload_id'], index, content[index * 5:index * 5 + 5]).status_code, 200)
+
+        # An interrupted upload learns what is left to send
+        self.assertEqual(sorted(self.client.get(f'/files/uploads/{upload["upload_id"]}').json()['received_chunks']), [0, 1, 3, 4])
+        response = self.client.post(f'/files/uploads/{upload["upload_id"]}/commit')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': '1 chunks are missing'})
+
+        # Resending a chunk is harmless
+        for index in (2, 2):
+            self.assertEqual(self.put_chunk(upload['upload_id'], index, content[10:15]).status_code, 200)
+        response = self.client.post(f'/files/uploads/{upload["upload_id"]}/commit')
+        self.assertEqual(response.status_code, 201)
+
+        file = File.objects.get(id=response.json()['file_id'])
+        with open(blob_full_path(file.file_path), 'rb') as blob:
+            self.assertEqual(blob.read(), content)
+        self.assertEqual((file.size, file.sha256), (len(content), hashlib.sha256(content).hexdigest()))
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_chunks_must_have_their_exact_size(self):
+        upload = self.create(8, 5)
+        self.assertEqual(self.put_chunk(upload['upload_id'], 0, b'0123').status_code, 400)
+        self.assertEqual(self.put_chunk(upload['upload_id'], 1, b'5678').status_code, 400)
+        self.assertEqual(self.put_chunk(upload['upload_id'], 1, b'567').status_code, 200)
+        self.assertEqual(self.put_chunk(upload['upload_id'], 2, b'').status_code, 400)
+
+    def test_expired_sessions_are_gone(self):
+        upload = self.create(5, 5)
+        UploadSession.objects.filter(id=upload['upload_id']).update(expiration_time=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.put_chunk(upload['upload_id'], 0, b'01234').status_code, 410)
+        self.assertEqual(self.client.post(f'/files/uploads/{upload["upload_id"]}/commit').status_code, 410)
+
+    def test_sessions_are_private(self):
+        upload = self.create(5, 5)
+        self.authenticate(self.recipient)
+        self.assertEqual(self.client.get(f'/files/uploads/{upload["upload_id"]}').status_code, 404)
+
+    def test_failed_commits_keep_the_session(self):
+        upload_session = self.create_upload_session(5, received_chunks=5)
+        url = f'/files/uploads/{upload_session.id}/commit'
+        with mock.patch.object(File.objects, 'create', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.client.post(url)
+        # The session can be committed again, its bytes were put back
+        self.assertEqual(self.stored_files(), [os.path.relpath(upload_session.staging_path, 'encrypted_files')])
+        self.assertEqual(self.client.post(url).status_code, 201)
+
+    def test_concurrent_commits_create_one_file(self):
+        upload_session = self.create_upload_session(5, received_chunks=5)
+
+        def commit_meanwhile(staging_path):
+            # Another commit claims the session between the chunk check and this one's claim
+            UploadSession.objects.filter(id=upload_session.id).delete()
+            return hash_blob(staging_path)
+
+        with mock.patch('files.views.hash_blob', side_effect=commit_meanwhile):
+            response = self.client.post(f'/files/uploads/{upload_session.id}/commit')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(File.objects.exists())
+        self.assertEqual(StorageUsage.objects.get(user=self.owner).bytes_used, 0)
+        self.assertTrue(os.path.exists(blob_full_path(upload_session.staging_path)))
+
+    def test_cancel_removes_the_staging_file(self):
+        upload = self.create(5, 5)
+        staging_path = UploadSession.objects.get(id=upload['upload_id']).staging_path
+        self.assertEqual(self.client.delete(f'/files/uploads/{upload["upload_id"]}/delete').status_code, 200)
+        self.assertFalse(os.path.exists(blob_full_path(staging_path)))
+
+
+class OffloadedDownloadTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.file = self.add_files(1, with_blobs=True)[0]
+        self.url = f'/files/{self.file.id}/download/raw'
+
+    def test_x_accel_redirect(self):
+        with self.settings(FILE_SERVE_BACKEND='x-accel-redirect', FILE_SERVE_INTERNAL_URL='/protected/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        internal_path = os.path.relpath(self.file.file_path, 'encrypted_files').replace(os.sep, '/')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{internal_path}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], file_etag(self.file))
+        self.assertEqual(response['X-Encrypted-Key'], 'key')
+
+    def test_x_sendfile(self):
+        with self.settings(FILE_SERVE_BACKEND='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Sendfile'], blob_full_path(self.file.file_path))
+        self.assertEqual(response.content, b'')
+
+    def test_sendfile_marks_the_region_to_send(self):
+        request = RequestFactory().get(self.url, HTTP_RANGE='bytes=2-4')
+        request.scope = {'extensions': {ZERO_COPY_EXTENSION: {}}}
+        with self.settings(FILE_SERVE_BACKEND='sendfile'):
+            response = offloaded_file_response(request, self.file.file_path)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], 'bytes 2-4/9')
+            self.assertEqual(response[ZERO_COPY_HEADER], f'2;3;{quote(blob_full_path(self.file.file_path))}')
+
+            # Without the server extension, or for several ranges, Django streams the file
+            self.assertIsNone(offloaded_file_response(RequestFactory().get(self.url), self.file.file_path))
+            request = RequestFactory().get(self.url, HTTP_RANGE='bytes=0-1,4-5')
+            request.scope = {'extensions': {ZERO_COPY_EXTENSION: {}}}
+            self.assertIsNone(offloaded_file_response(request, self.file.file_path))
+
+    def run_middleware(self, method):
+        path = blob_full_path(self.file.file_path)
+        sent = []
+
+        async def app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-length', b'3'), (ZERO_COPY_HEADER.encode(), f'2;3;{quote(path)}'.encode())
+            ]})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def send(message):
+            if message['type'] == ZERO_COPY_EXTENSION:
+                message = {**message, 'file': message['file'].name}
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': method, 'extensions': {ZERO_COPY_EXTENSION: {}}}
+        asyncio.run(ZeroCopyFileMiddleware(app)(scope, None, send))
+        return sent
+
+    def test_middleware_sends_the_region_with_zero_copy(self):
+        start, body = self.run_middleware('GET')
+        self.assertEqual(start['headers'], [(b'content-length', b'3')])
+        self.assertEqual(body, {
+            'type': ZERO_COPY_EXTENSION, 'file': blob_full_path(self.file.file_path), 'offset': 2, 'count': 3
+        })
+
+    def test_middleware_sends_no_body_for_head(self):
+        start, body = self.run_middleware('HEAD')
+        self.assertEqual(start['headers'], [(b'content-length', b'3')])
+        self.assertEqual(body, {'type': 'http.response.body', 'body': b''})
+
+
+class BlobLayoutTests(FileTestCase):
+    def add_flat_files(self, contents):
+        files = []
+        for index, content in enumerate(contents):
+            file_path = os.path.join('encrypted_files', f'flat-{index}.bin')
+            os.makedirs(blob_full_path('encrypted_files'), exist_ok=True)
+            with open(blob_full_path(file_path), 'wb') as blob:
+                blob.write(content)
+            files.append(File.objects.create(file_name=f'flat-{index}.bin', file_path=file_path, encrypted_key='key', uploaded_by=self.owner))
+        return files
+
+    def test_new_blobs_are_fanned_out(self):
+        file_path = new_blob_path('.bin')
+        self.assertEqual(file_path, sharded_blob_path(os.path.basename(file_path)))
+        first, second, name = os.path.relpath(file_path, 'encrypted_files').split(os.sep)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 2)
+        self.assertTrue(os.path.isdir(os.path.dirname(blob_full_path(file_path))))
+
+    def test_shard_command_moves_flat_blobs(self):
+        files = self.add_flat_files([b'first', b'second'])
+        sharded = self.add_files(1, with_blobs=True)[0]
+        os.remove(blob_full_path(files[1].file_path))
+
+        call_command('shard_blob_store', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(File.objects.get(id=files[0].id).file_path, files[0].file_path)
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('shard_blob_store', '--batch-size', '1', stdout=out, stderr=err)
+        self.assertIn('Moved 1, already sharded 1, missing 1', out.getvalue())
+        self.assertIn(f'Blob missing for file {files[1].id}', err.getvalue())
+
+        moved = File.objects.get(id=files[0].id)
+        self.assertEqual(moved.file_path, sharded_blob_path('flat-0.bin'))
+        self.assertFalse(os.path.exists(blob_full_path(files[0].file_path)))
+        with open(blob_full_path(moved.file_path), 'rb') as blob:
+            self.assertEqual(blob.read(), b'first')
+        self.assertEqual(File.objects.get(id=sharded.id).file_path, sharded.file_path)
+
+        # Re-running after the move is a no-op
+        out = io.StringIO()
+        call_command('shard_blob_store', stdout=out, stderr=io.StringIO())
+        self.assertIn('Moved 0, already sharded 2, missing 1', out.getvalue())
+
+    def test_shard_command_leaves_changed_rows_alone(self):
+        deleted, repointed = self.add_flat_files([b'deleted', b'repointed'])
+        command = ShardBlobStoreCommand()
+        File.objects.filter(id=deleted.id).delete()
+        File.objects.filter(id=repointed.id).update(file_path=self.write_blob(b'new'))
+
+        for file in (deleted, repointed):
+            with self.subTest(file.file_name):
+                target_path = sharded_blob_path(os.path.basename(file.file_path))
+                self.assertFalse(command.move_blob(file.id, file.file_path, target_path))
+                # The blob stays where the reclaimer or the new row expect it
+                self.assertTrue(os.path.exists(blob_full_path(file.file_path)))
+                self.assertFalse(os.path.exists(blob_full_path(target_path)))
+
+
+class StreamedUploadTests(FileTestCase):
+    def test_upload_is_streamed_to_its_blob(self):
+        response = self.client.post('/files/upload', {
+            'file': SimpleUploadedFile('upload.bin', b'encrypted bytes'), 'file_name': 'upload.bin', 'encrypted_key': 'key'
+        })
+        self.assertEqual(response.status_code, 201)
+        file = File.objects.get()
+        self.assertEqual(self.stored_files(), [os.path.relpath(file.file_path, 'encrypted_files')])
+        with open(blob_full_path(file.file_path), 'rb') as blob:
+            self.assertEqual(blob.read(), b'encrypted bytes')
+        self.assertEqual(file.sha256, hashlib.sha256(b'encrypted bytes').hexdigest())
+
+    def test_rejected_upload_leaves_no_parts(self):
+        response = self.client.post('/files/upload', {'file': SimpleUploadedFile('upload.bin', b'encrypted')})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_oversized_file_is_cut_off(self):
+        with self.settings(UPLOAD_MAX_FILE_SIZE=5):
+            response = self.upload_batch([b'small', b'too large', b'third'])
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json(), {'error': 'File is too large'})
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(File.objects.exists())
+
+    def test_aborted_parse_removes_completed_parts(self):
+        with self.settings(DATA_UPLOAD_MAX_NUMBER_FILES=2):
+            response = self.upload_batch([b'first', b'second', b'third'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(File.objects.exists())
+
+
+class FileEtagTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.file = self.add_files(1, with_blobs=True)[0]
+        self.requests = {
+            'raw': lambda **headers: self.client.get(f'/files/{self.file.id}/download/raw', **headers),
+            'details': lambda **headers: self.client.get(f'/files/{self.file.id}', **headers),
+            'json': lambda **headers: self.client.post(f'/files/{self.file.id}/download', **headers),
+        }
+
+    def test_unchanged_files_are_not_modified(self):
+        etags = set()
+        for name, request in self.requests.items():
+            with self.subTest(name):
+                etag = request()['ETag']
+                etags.add(etag)
+                for if_none_match in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+                    response = request(HTTP_IF_NONE_MATCH=if_none_match)
+                    self.assertEqual(response.status_code, 304)
+                    self.assertEqual(response['ETag'], etag)
+                self.assertEqual(request(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        # Each representation has its own tag
+        self.assertEqual(len(etags), 3)
+        self.assertEqual(self.requests['raw']()['ETag'], file_etag(self.file))
+
+    def test_metadata_changes_are_modified(self):
+        etags = {name: request()['ETag'] for name, request in self.requests.items()}
+        for field, value in (('file_name', 'renamed.bin'), ('encrypted_key', 'rotated')):
+            File.objects.filter(id=self.file.id).update(**{field: value})
+            for name, request in self.requests.items():
+                with self.subTest(field=field, request=name):
+                    response = request(HTTP_IF_NONE_MATCH=etags[name])
+                    self.assertEqual(response.status_code, 200)
+                    self.assertNotEqual(response['ETag'], etags[name])
+                    etags[name] = response['ETag']
+        self.assertEqual(self.requests['raw']()['X-File-Name'], 'renamed.bin')
+
+    def test_files_without_a_digest_have_no_etag(self):
+        File.objects.filter(id=self.file.id).update(sha256='')
+        for name, request in self.requests.items():
+            with self.subTest(name):
+                response = request(HTTP_IF_NONE_MATCH='*')
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('ETag', response)
+
+    def test_backfill_blob_digests(self):
+        missing = self.add_files(1)[0]
+        File.objects.update(size=0, sha256='')
+        err = io.StringIO()
+        call_command('backfill_blob_digests', '--batch-size', '1', stdout=io.StringIO(), stderr=err)
+
+        self.file.refresh_from_db()
+        self.assertEqual((self.file.size, self.file.sha256), (9, hashlib.sha256(b'encrypted').hexdigest()))
+        self.assertEqual(File.objects.get(id=missing.id).sha256, '')
+        self.assertIn(f'Blob missing for file {missing.id}', err.getvalue())
+
+
+class ZipDownloadTests(FileTestCase):
+    def download(self, file_ids):
+        return self.client.post('/files/download/zip', {'file_ids': file_ids}, content_type='application/json')
+
+    def test_archive_holds_the_blobs_and_a_manifest(self):
+        mine = self.add_files(1, with_blobs=True)[0]
+        shared = self.add_files(1, owner=self.recipient, share_with=self.owner, with_blobs=True)[0]
+        File.objects.filter(id=shared.id).update(file_name='dir/name.bin')
+
+        response = self.download([shared.id, mine.id, shared.id])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="files.zip"')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+
+        names = [f'{shared.id}_dir_name.bin', f'{mine.id}_file-0.bin']
+        self.assertEqual(archive.namelist(), names + ['manifest.json'])
+        for name in names:
+            self.assertEqual(archive.read(name), b'encrypted')
+            self.assertEqual(archive.getinfo(name).compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(json.loads(archive.read('manifest.json')), [
+            {'file_id': shared.id, 'file_name': 'dir/name.bin', 'path': names[0], 'encrypted_key': 'key',
+             'key_owner_username': self.recipient.username, 'sha256': shared.sha256},
+            {'file_id': mine.id, 'file_name': 'file-0.bin', 'path': names[1], 'encrypted_key': 'key',
+             'key_owner_username': self.owner.username, 'sha256': mine.sha256},
+        ])
+
+    def test_large_blobs_are_streamed_in_chunks(self):
+        file = self.add_files(1)[0]
+        content = os.urandom(5000)
+        File.objects.filter(id=file.id).update(file_path=self.write_blob(content))
+        with self.settings(DOWNLOAD_CHUNK_SIZE=1024):
+            response = self.download([file.id])
+            chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 5)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(archive.read(f'{file.id}_file-0.bin'), content)
+
+    def test_every_file_must_be_downloadable(self):
+        viewable = self.add_files(1, owner=self.recipient, share_with=self.owner, permission=PERM_VIEW, with_blobs=True)[0]
+        private = self.add_files(1, owner=self.recipient, with_blobs=True)[0]
+        mine = self.add_files(1, with_blobs=True)[0]
+        response = self.download([mine.id, viewable.id, private.id])
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['file_ids'], sorted([viewable.id, private.id]))
+
+    def test_missing_blobs_are_reported_before_streaming(self):
+        file = self.add_files(1)[0]
+        response = self.download([file.id])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['files'], [f'{file.id}_file-0.bin'])
+
+
+class BatchUploadTests(FileTestCase):
+    def test_files_are_created_in_order(self):
+        response = self.upload_batch([b'first', b'second', b'third'])
+        self.assertEqual(response.status_code, 201)
+        files = File.objects.in_bulk(response.json()['file_ids'])
+        for index, file_id in enumerate(response.json()['file_ids']):
+            self.assertEqual(files[file_id].file_name, f'{index}.bin')
+            with open(blob_full_path(files[file_id].file_path), 'rb') as blob:
+                self.assertEqual(blob.read(), [b'first', b'second', b'third'][index])
+        self.assertEqual(len(self.stored_files()), 3)
+
+    def test_batch_size_is_limited(self):
+        with self.settings(BULK_MAX_FILES=2, DATA_UPLOAD_MAX_NUMBER_FILES=2):
+            response = self.upload_batch([b'first', b'second', b'third'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'At most 2 files can be uploaded at once'})
+        self.assertEqual(self.stored_files(), [])
+
+    def test_every_file_needs_its_fields(self):
+        response = self.client.post('/files/upload/batch', {
+            'file': [SimpleUploadedFile('a.bin', b'first'), SimpleUploadedFile('b.bin', b'second')],
+            'file_name': ['a.bin', 'b.bin'],
+            'encrypted_key': ['key']
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(File.objects.exists())
+
+
+class FileDeletionTestCase(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.file = self.add_files(1, share_with=self.recipient, with_blobs=True)[0]
+        StorageUsage.objects.filter(user=self.owner).update(bytes_used=9, file_count=1)
+
+    def list_versions(self):
+        return dict(ListVersion.objects.values_list('username', 'version'))
+
+    def assertDeleted(self, versions):
+        """The file is gone, its blob queued but still on disk, and its owner's storage released"""
+        self.assertFalse(File.objects.filter(id=self.file.id).exists())
+        self.assertFalse(FileShare.objects.filter(file_id=self.file.id).exists())
+        self.assertEqual(list(PendingBlobDeletion.objects.values_list('file_path', flat=True)), [self.file.file_path])
+        self.assertTrue(os.path.exists(blob_full_path(self.file.file_path)))
+        usage = StorageUsage.objects.get(user=self.owner)
+        self.assertEqual((usage.bytes_used, usage.file_count), (0, 0))
+        new_versions = self.list_versions()
+        for username in (self.owner.username, self.recipient.username):
+            self.assertEqual(new_versions[username], versions[username] + 1)
+
+
+class FileDeletionTests(FileDeletionTestCase):
+    def test_delete_queues_the_blob_for_the_reclaimer(self):
+        versions = self.list_versions()
+        self.assertEqual(self.client.delete(f'/files/{self.file.id}/delete').status_code, 200)
+        self.assertDeleted(versions)
+
+        call_command('reclaim_blobs', stdout=io.StringIO())
+        self.assertFalse(os.path.exists(blob_full_path(self.file.file_path)))
+        self.assertFalse(PendingBlobDeletion.objects.exists())
+
+    def test_bulk_delete_only_takes_owned_files(self):
+        theirs = self.add_files(1, owner=self.recipient)[0]
+        response = self.client.post('/files/delete', {'file_ids': [self.file.id, theirs.id]}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['file_ids'], [theirs.id])
+        self.assertEqual(File.objects.count(), 2)
+
+        versions = self.list_versions()
+        response = self.client.post('/files/delete', {'file_ids': [self.file.id]}, content_type='application/json')
+        self.assertEqual(response.json(), {'message': '1 files deleted successfully'})
+        self.assertDeleted(versions)
+
+    def test_reclaimer_expires_upload_sessions(self):
+        upload_session = self.create_upload_session(10)
+        fresh_session = self.create_upload_session(10)
+        UploadSession.objects.filter(id=upload_session.id).update(expiration_time=timezone.now() - timedelta(seconds=1))
+        out = io.StringIO()
+        call_command('reclaim_blobs', stdout=out)
+        self.assertIn('expired 1 upload sessions', out.getvalue())
+        self.assertEqual(list(UploadSession.objects.values_list('id', flat=True)), [fresh_session.id])
+        self.assertFalse(os.path.exists(blob_full_path(upload_session.staging_path)))
+        self.assertTrue(os.path.exists(blob_full_path(fresh_session.staging_path)))
+
+
+class FileAdminTests(FileDeletionTestCase):
+    """Admin changes go through the same bookkeeping as the API"""
+
+    def setUp(self):
+        super().setUp()
+        admin = self.create_user('root', role=ROLE_ADMIN)
+        admin.is_superuser = True
+        admin.save()
+        self.client.force_login(admin)
+
+    def test_admin_delete(self):
+        versions = self.list_versions()
+        response = self.client.post(f'/admin/files/file/{self.file.id}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertDeleted(versions)
+
+    def test_admin_bulk_delete(self):
+        versions = self.list_versions()
+        response = self.client.post('/admin/files/file/', {
+            'action': 'delete_selected', '_selected_action': [self.file.id], 'post': 'yes'
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertDeleted(versions)
+
+    def test_admin_share_changes_bump_list_versions(self):
+        share = FileShare.objects.get(file=self.file)
+        versions = self.list_versions()
+        response = self.client.post(f'/admin/files/fileshare/{share.id}/change/', {
+            'file': self.file.id,
+            'shared_with_username': 'someone-else',
+            'shared_by': self.owner.id,
+            'permission_type': PERM_VIEW,
+        })
+        self.assertEqual(response.status_code, 302)
+        new_versions = self.list_versions()
+        self.assertEqual(new_versions[self.owner.username], versions[self.owner.username] + 1)
+        self.assertEqual(new_versions[self.recipient.username], versions[self.recipient.username] + 1)
+        self.assertEqual(new_versions['someone-else'], 1)
+
+        response = self.client.post(f'/admin/files/fileshare/{share.id}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.list_versions()['someone-else'], 2)
+
+    def test_admin_link_changes_bump_list_versions(self):
+        link = ShareableLink.objects.create(file=self.file, created_by=self.owner)
+        versions = self.list_versions()
+        response = self.client.post(f'/admin/files/shareablelink/{link.id}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.list_versions()[self.owner.username], versions[self.owner.username] + 1)
+
+
+class StorageQuotaTests(FileTestCase):
+    def set_quota(self, quota_bytes, bytes_used=0):
+        StorageUsage.objects.filter(user=self.owner).update(quota_bytes=quota_bytes, bytes_used=bytes_used)
+
+    def usage(self):
+        return {
+            user_id: (bytes_used, file_count)
+            for user_id, bytes_used, file_count in StorageUsage.objects.values_list('user_id', 'bytes_used', 'file_count')
+        }
+
+    def test_uploads_are_counted(self):
+        self.assertEqual(self.upload_batch([b'first', b'second']).status_code, 201)
+        response = self.client.get('/files/usage')
+        self.assertEqual(response.json(), {'bytes_used': 11, 'file_count': 2, 'quota_bytes': None, 'bytes_available': None})
+
+        self.set_quota(20, bytes_used=11)
+        self.assertEqual(self.client.get('/files/usage').json()['bytes_available'], 9)
+
+    def test_uploads_over_quota_are_rejected(self):
+        self.set_quota(10, bytes_used=5)
+        response = self.client.post('/files/upload', {
+            'file': SimpleUploadedFile('upload.bin', b'encrypted'), 'file_name': 'upload.bin', 'encrypted_key': 'key'
+        })
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.upload_batch([b'abc', b'def']).status_code, 413)
+        self.assertEqual(self.stored_files(), [])
+        self.assertEqual(StorageUsage.objects.get(user=self.owner).bytes_used, 5)
+
+        response = self.client.post('/files/uploads/create', {
+            'file_name': 'upload.bin', 'encrypted_key': 'key', 'total_size': 6
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+
+    def test_quota_counts_the_file_not_the_body(self):
+        # The multipart body is much larger than the 9 byte file that fills the quota exactly
+        self.set_quota(14, bytes_used=5)
+        response = self.client.post('/files/upload', {
+            'file': SimpleUploadedFile('upload.bin', b'encrypted'), 'file_name': 'upload.bin', 'encrypted_key': 'key'
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.usage()[self.owner.id], (14, 1))
+
+        self.set_quota(19, bytes_used=14)
+        self.assertEqual(self.upload_batch([b'ab', b'cd']).status_code, 201)
+        response = self.upload_batch([b'ab'])
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json(), {'error': 'Storage quota exceeded'})
+        self.assertEqual(len(self.stored_files()), 3)
+
+    def test_commit_rechecks_the_quota(self):
+        upload_session = self.create_upload_session(8, received_chunks=8)
+        self.set_quota(10, bytes_used=5)
+        response = self.client.post(f'/files/uploads/{upload_session.id}/commit')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(File.objects.exists())
+        self.assertEqual(StorageUsage.objects.get(user=self.owner).bytes_used, 5)
+
+    def test_migration_backfills_usage_of_existing_files(self):
+        backfill_storage_usage = importlib.import_module('files.migrations.0011_backfill_storage_usage').backfill_storage_usage
+        unsized, sized = self.add_files(2, with_blobs=True)
+        theirs = self.add_files(1, owner=self.recipient, with_blobs=True)[0]
+        File.objects.filter(id__in=[unsized.id, theirs.id]).update(size=0, sha256='')
+        StorageUsage.objects.all().delete()
+
+        # Files are counted right away, unsized ones are weighed by the commands afterwards
+        backfill_storage_usage(django_apps, None)
+        self.assertEqual(self.usage(), {self.owner.id: (9, 2), self.recipient.id: (0, 1)})
+        call_command('backfill_blob_digests', stdout=io.StringIO(), stderr=io.StringIO())
+        call_command('recompute_storage_usage', stdout=io.StringIO())
+        self.assertEqual(self.usage(), {self.owner.id: (18, 2), self.recipient.id: (9, 1)})
+
+
+class KeysetPaginationTests(FileTestCase):
+    def page_through(self, url, page_size):
+        rows, cursor = [], None
+        while True:
+            params = {'page_size': page_size, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            rows.extend(response.json()['results'])
+            cursor = response.json()['next_cursor']
+            if cursor is None:
+                return rows
+
+    def assertCursorPlan(self, queryset):
+        """The page after a cursor seeks into the index instead of walking all newer entries"""
+        with CaptureQueriesContext(connection) as queries:
+            keyset_page(queryset, 10, encode_cursor(timezone.now(), 5))
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries.captured_queries[-1]['sql'])
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertRegex(plan, r'USING (COVERING )?INDEX \S+ \(\w+=\? AND created_at<\?\)')
+
+    def test_pages_continue_across_equal_timestamps(self):
+        files = self.add_files(12)
+        # Ties on created_at are ordered by id
+        File.objects.filter(id__in=[file.id for file in files[2:9]]).update(created_at=timezone.now() - timedelta(hours=1))
+        expected = list(File.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        for page_size in (1, 3, 5, 12, 20):
+            with self.subTest(page_size=page_size):
+                self.assertEqual([row['id'] for row in self.page_through('/files/list', page_size)], expected)
+
+    def test_unpaginated_list_is_unchanged(self):
+        self.add_files(3)
+        self.assertEqual(len(self.client.get('/files/list').json()), 3)
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'W1siMjAyNiIsIDFdXQ', encode_cursor(timezone.now(), 1)[:-3]):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/files/list', {'cursor': cursor}).status_code, 400)
+
+    def test_cursor_query_is_an_index_range_scan(self):
+        self.assertCursorPlan(File.objects.filter(uploaded_by_id=self.owner.id).values(*FILE_LIST_FIELDS))
+
+    def test_my_shares_pages_continue_across_equal_timestamps(self):
+        self.add_files(4, share_with=self.recipient)
+        self.add_files(5, owner=self.create_user('other'), share_with=self.recipient)
+        FileShare.objects.filter(id__in=FileShare.objects.order_by('id').values('id')[1:7]).update(created_at=timezone.now() - timedelta(hours=1))
+        expected = list(
+            FileShare.objects.filter(shared_with_username=self.recipient.username)
+            .order_by('-created_at', '-id').values_list('file_id', flat=True)
+        )
+        self.authenticate(self.recipient)
+        for page_size in (1, 2, 4, 9):
+            with self.subTest(page_size=page_size):
+                self.assertEqual([row['id'] for row in self.page_through('/files/shares/me', page_size)], expected)
+
+    def test_my_shares_cursor_query_is_an_index_range_scan(self):
+        self.assertCursorPlan(FileShare.objects.filter(shared_with_username=self.recipient.username).values(*SHARED_FILE_LIST_FIELDS))
+
+
+class ListEtagTests(FileTestCase):
+    urls = ('/files/list', '/files/shares/me')
+
+    def list_etags(self, user):
+        """The ETag of each list endpoint as seen by `user`, leaving the client logged in as the owner"""
+        self.authenticate(user)
+        etags = []
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etags.append(response['ETag'])
+        self.authenticate(self.owner)
+        return etags
+
+    def assertListsChanged(self, change, owner=True, recipient=True):
+        before = {user: self.list_etags(user) for user in (self.owner, self.recipient)}
+        change()
+        for user, changed in ((self.owner, owner), (self.recipient, recipient)):
+            for url, old, new in zip(self.urls, before[user], self.list_etags(user)):
+                with self.subTest(user=user.username, url=url):
+                    self.assertEqual(old != new, changed)
+
+    def test_unchanged_lists_are_not_modified(self):
+        self.add_files(2, share_with=self.recipient)
+        for url in self.urls:
+            with self.subTest(url):
+                etag = self.client.get(url)['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        # Every user has their own tags
+        self.assertNotEqual(self.list_etags(self.owner), self.list_etags(self.recipient))
+
+    def test_changes_invalidate_the_affected_lists(self):
+        file = self.add_files(1, with_blobs=True)[0]
+        self.assertListsChanged(
+            lambda: self.client.post('/files/upload', {
+                'file': SimpleUploadedFile('new.bin', b'encrypted'), 'file_name': 'new.bin', 'encrypted_key': 'key'
+            }),
+            recipient=False
+        )
+        self.assertListsChanged(lambda: self.client.post(
+            f'/files/{file.id}/shares/add', {'shared_with_username': self.recipient.username, 'permission_type': PERM_VIEW}
+        ))
+        share = FileShare.objects.get(file=file)
+        self.assertListsChanged(lambda: self.client.put(
+            f'/files/{file.id}/shares/{share.id}', {'permission_type': PERM_DOWNLOAD}, content_type='application/json'
+        ))
+        self.assertListsChanged(lambda: self.client.post(f'/files/{file.id}/links/generate'), recipient=False)
+        self.assertListsChanged(lambda: self.client.delete(f'/files/{file.id}/shares/{share.id}/delete'))
+        self.share([file], self.recipient)
+        self.assertListsChanged(lambda: self.client.delete(f'/files/{file.id}/delete'))
+
+
+class DashboardTests(FileTestCase):
+    def dashboard(self, **params):
+        response = self.client.get('/files/dashboard', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_pages_and_counts(self):
+        for index in range(3):
+            self.client.post('/files/upload', {
+                'file': SimpleUploadedFile(f'{index}.bin', b'encrypted'), 'file_name': f'{index}.bin', 'encrypted_key': 'key'
+            })
+        shared = self.add_files(3, owner=self.recipient, share_with=self.owner)
+
+        dashboard = self.dashboard(page_size=2)
+        self.assertEqual(dashboard['user']['username'], self.owner.username)
+        self.assertEqual([file['file_name'] for file in dashboard['files']['results']], ['2.bin', '1.bin'])
+        self.assertEqual(dashboard['files']['count'], 3)
+        self.assertEqual(len(dashboard['shared_files']['results']), 2)
+        self.assertEqual(dashboard['shared_files']['count'], 3)
+
+        # The cursors continue on the list endpoints
+        rest = self.client.get('/files/shares/me', {'page_size': 2, 'cursor': dashboard['shared_files']['next_cursor']})
+        self.assertEqual(
+            {row['id'] for row in dashboard['shared_files']['results'] + rest.json()['results']},
+            set(FileShare.objects.filter(file__in=shared).values_list('id', flat=True))
+        )
+        rest = self.client.get('/files/list', {'page_size': 2, 'cursor': dashboard['files']['next_cursor']})
+        self.assertEqual([file['file_name'] for file in rest.json()['results']], ['0.bin'])
+
+    def test_owned_count_comes_from_the_usage_counter(self):
+        self.add_files(2)
+        StorageUsage.objects.filter(user=self.owner).update(file_count=5)
+        dashboard = self.dashboard()
+        self.assertEqual((len(dashboard['files']['results']), dashboard['files']['count']), (2, 5))
+        self.assertIsNone(dashboard['files']['next_cursor'])
+
+    def test_guests_only_see_shared_files(self):
+        guest = self.create_user('guest', role=ROLE_GUEST)
+        self.add_files(2, share_with=guest)
+        self.authenticate(guest)
+        dashboard = self.dashboard()
+        self.assertEqual(dashboard['files'], {'results': [], 'next_cursor': None, 'count': 0})
+        self.assertEqual(len(dashboard['shared_files']['results']), 2)
+        self.assertEqual(dashboard['shared_files']['count'], 2)
+        self.assertIsNone(dashboard['shared_files']['next_cursor'])
+
+
+class FileSearchTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        if not fts_available():
+            self.skipTest('the database has no FTS5 index')
+
+    def search(self, query, **params):
+        response = self.client.get('/files/search', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def names(self, query):
+        return sorted(result['file_name'] for result in self.search(query)['results'])
+
+    def add_named(self, *names, owner=None, share_with=None):
+        files = self.add_files(len(names), owner=owner, share_with=share_with)
+        for file, name in zip(files, names):
+            file.file_name = name
+            file.save()
+        return files
+
+    def test_only_visible_files_are_found(self):
+        self.add_named('quarterly report.pdf', 'holiday.jpg')
+        self.add_named('shared report.doc', owner=self.recipient, share_with=self.owner)
+        self.add_named('private report.doc', owner=self.recipient)
+        self.assertEqual(self.names('report'), ['quarterly report.pdf', 'shared report.doc'])
+
+    def test_index_follows_renames_and_deletes(self):
+        renamed, deleted = self.add_named('draft.txt', 'obsolete.txt')
+        File.objects.filter(id=renamed.id).update(file_name='final.txt')
+        self.assertEqual(self.names('draft'), [])
+        self.assertEqual(self.names('final'), ['final.txt'])
+
+        self.client.delete(f'/files/{deleted.id}/delete')
+        self.assertEqual(self.names('obsolete'), [])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid FROM files_fts WHERE files_fts MATCH '\"txt\"'")
+            self.assertEqual([row[0] for row in cursor.fetchall()], [renamed.id])
+
+    def test_short_queries_fall_back_to_a_substring_scan(self):
+        self.add_named('ab.txt', 'other.txt')
+        with mock.patch('files.search.ranked_file_ids') as ranked_file_ids:
+            self.assertEqual(self.names('ab'), ['ab.txt'])
+        ranked_file_ids.assert_not_called()
+
+    def test_queries_are_not_parsed_as_fts_syntax(self):
+        self.add_named('hello OR bye.txt')
+        self.assertEqual(self.names('hello OR'), ['hello OR bye.txt'])
+        self.assertEqual(self.names('NOT bye'), [])
+
+    def test_pages(self):
+        self.add_named(*[f'page-{index}.txt' for index in range(5)])
+        first = self.search('page', page_size=3)
+        second = self.search('page', page_size=3, page=2)
+        self.assertEqual((len(first['results']), first['has_more']), (3, True))
+        self.assertEqual((len(second['results']), second['has_more']), (2, False))
+        self.assertEqual(len({result['id'] for result in first['results'] + second['results']}), 5)
+
+class FileAdminQueryBudgetTests(QueryBudgetTestCase):
+    def test_changelist_counts_shares_in_one_query(self):
+        admin = self.create_user('root', role=ROLE_ADMIN)
+        admin.is_superuser = True
+        admin.save()
+        request = RequestFactory().get('/admin/files/file/')
+        request.user = admin
+        model_admin = FileAdmin(File, admin_site)
+
+        def seed(count):
+            files = File.objects.bulk_create(
+                File(file_name=f'file-{index}.bin', file_path='missing', encrypted_key='key', uploaded_by=admin)
+                for index in range(count)
+            )
+            FileShare.objects.bulk_create(
+                FileShare(file=file, shared_with_username='reader', shared_by=admin) for file in files
+            )
+
+        def render_changelist(_):
+            response = model_admin.changelist_view(request)
+            response.render()
+            return response
+
+        self.assertQueryBudget(4, seed, render_changelist)
@@ -0,0 +1,151 @@
+import hashlib
+import os
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from .storage import blob_full_path, new_blob_path
+
+PARTIAL_SUFFIX = '.part'
+
+
+class FileTooLarge(Exception):
+    """A file part went over UPLOAD_MAX_FILE_SIZE and the rest of the body was dropped"""
+
+
+class QuotaExceeded(Exception):
+    """The file parts went over the room left in the user's quota and the rest of the body was dropped"""
+
+
+class BlobUploadedFile(UploadedFile):
+    """
+    An upload already written next to its final blob path.
+    commit() atomically renames it into place, discard() removes it.
+    """
+
+    def __init__(self, file, file_path, sha256, name, content_type, size, charset, content_type_extra=None):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.file_path = file_path
+        self.sha256 = sha256
+
+    def temporary_path(self):
+        return blob_full_path(self.file_path) + PARTIAL_SUFFIX
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.temporary_path(), blob_full_path(self.file_path))
+        return self.file_path
+
+    def discard(self):
+        self.file.close()
+        remove_part(self.temporary_path())
+
+
+class BlobUploadHandler(FileUploadHandler):
+    """
+    Stream multipart file parts straight into the blob store, without
+    buffering them in memory or in a temporary file first. The SHA-256
+    of each file is computed as its chunks are written.
+    With `room`, the file parts together may not be larger than that many bytes.
+    """
+
+    def __init__(self, request=None, room=None):
+        super().__init__(request)
+        self.room = room
+        self.received = 0
+        self.partial_path = None
+        # Every part written, completed ones included, for cleanup if parsing fails
+        self.partial_paths = []
+        self.too_large = False
+        self.over_quota = False
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.file_path = new_blob_path(os.path.splitext(self.file_name)[1])
+        self.partial_path = blob_full_path(self.file_path) + PARTIAL_SUFFIX
+        self.partial_paths.append(self.partial_path)
+        self.file = open(self.partial_path, 'wb+')
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.UPLOAD_MAX_FILE_SIZE:
+            self.too_large = True
+            raise StopUpload(connection_reset=True)
+        self.received += len(raw_data)
+        if self.room is not None and self.received > self.room:
+            self.over_quota = True
+            raise StopUpload(connection_reset=True)
+        self.file.write(raw_data)
+        self.hasher.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        self.partial_path = None
+        return BlobUploadedFile(
+            self.file,
+            self.file_path,
+            self.hasher.hexdigest(),
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.content_type_extra
+        )
+
+    def upload_interrupted(self):
+        self.remove_partial()
+
+    def upload_complete(self):
+        # A file still in progress here was cut off by StopUpload
+        self.remove_partial()
+
+    def remove_partial(self):
+        if self.partial_path is None:
+            return
+        self.file.close()
+        remove_part(self.partial_path)
+        self.partial_path = None
+
+    def discard(self):
+        """Remove every part written so far, for when parsing the body failed"""
+        self.remove_partial()
+        for partial_path in self.partial_paths:
+            remove_part(partial_path)
+        self.partial_paths = []
+
+
+def remove_part(partial_path):
+    try:
+        os.remove(partial_path)
+    except FileNotFoundError:
+        pass
+
+
+def parse_uploads(request, room=None):
+    """
+    Parse the multipart body of `request`, streaming its file parts into the blob store.
+    Django gives upload handlers no callback when parsing raises (too many files,
+    a client disconnect, ...), so the parts written until then are removed here.
+    Raises FileTooLarge if a file went over the size cap and QuotaExceeded if
+    the files went over `room` bytes, with every part removed.
+    """
+    handler = BlobUploadHandler(request, room)
+    request.upload_handlers = [handler]
+    try:
+        request.FILES
+    except Exception:
+        handler.discard()
+        raise
+    if handler.too_large or handler.over_quota:
+        # The parser stopped at that file, what it returned is incomplete
+        discard_uploads(request)
+        handler.discard()
+        raise FileTooLarge if handler.too_large else QuotaExceeded
+
+
+def discard_uploads(request):
+    """Remove partially stored blobs of a rejected upload request"""
+    for _, uploads in request.FILES.lists():
+        for uploaded in uploads:
+            if isinstance(uploaded, BlobUploadedFile):
+                uploaded.discard()
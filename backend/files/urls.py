@@ -4,14 +4,27 @@ from . import views
 urlpatterns = [
     path('list', views.list_files, name='list_files'),
     path('upload', views.upload_file, name='upload_file'),
+    path('upload/batch', views.upload_files_batch, name='upload_files_batch'),
+    path('usage', views.get_storage_usage, name='get_storage_usage'),
+    path('uploads/create', views.create_upload_session, name='create_upload_session'),
+    path('uploads/<uuid:upload_id>', views.get_upload_session, name='get_upload_session'),
+    path('uploads/<uuid:upload_id>/chunks/<int:chunk_index>', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/commit', views.commit_upload_session, name='commit_upload_session'),
+    path('uploads/<uuid:upload_id>/delete', views.delete_upload_session, name='delete_upload_session'),
     path('<int:file_id>', views.get_file_details, name='get_file_details'),
     path('<int:file_id>/download', views.download_file, name='download_file'),
+    path('<int:file_id>/download/raw', views.download_file_raw, name='download_file_raw'),
+    path('download/zip', views.download_files_zip, name='download_files_zip'),
+    path('<int:file_id>/delete', views.delete_file, name='delete_file'),
+    path('delete', views.delete_files_bulk, name='delete_files_bulk'),
     path('<int:file_id>/shares/list', views.list_file_shares, name='list_file_shares'),
     path('<int:file_id>/shares/add', views.add_share, name='add_share'),
     path('<int:file_id>/shares/<int:share_id>/delete', views.delete_share, name='delete_share'),
     path('<int:file_id>/shares/<int:share_id>', views.update_share, name='update_share'),
     path('<int:file_id>/permission', views.get_file_permission, name='get_file_permission'),
     path('shares/me', views.list_my_shares, name='list_my_shares'),
+    path('search', views.search_files_view, name='search_files'),
+    path('dashboard', views.get_dashboard, name='get_dashboard'),
     path('<int:file_id>/links/generate', views.generate_link, name='generate_link'),
     path('links/verify', views.verify_link, name='verify_link'),
 ] 
\ No newline at end of file
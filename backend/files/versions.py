@@ -0,0 +1,21 @@
+from django.db.models import F
+from .models import ListVersion
+
+
+def get_list_version(username):
+    version = ListVersion.objects.filter(username=username).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_list_versions(usernames):
+    """Invalidate the cached lists of `usernames`, call it inside the changing transaction"""
+    usernames = set(usernames)
+    if not usernames:
+        return
+    # Rows exist for anyone who was bumped before, only insert the new ones
+    existing = set(ListVersion.objects.filter(username__in=usernames).values_list('username', flat=True))
+    ListVersion.objects.bulk_create(
+        [ListVersion(username=username) for username in usernames - existing],
+        ignore_conflicts=True
+    )
+    ListVersion.objects.filter(username__in=usernames).update(version=F('version') + 1)
@@ -1,63 +1,337 @@
 import os
-import uuid
+from urllib.parse import quote
 from django.conf import settings
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from users.decorators import jwt_required, mfa_enabled, role_required
-from .decorators import is_file_present, is_my_file, is_share_present, is_file_not_already_shared, has_file_access, is_link_token_valid
-from .models import File, FileShare, ShareableLink
-from .serializers import FileSerializer, FileUploadSerializer, FileShareSerializer, FileShareCreateSerializer, SharedFileSerializer
+from django.core.exceptions import TooManyFilesSent
+from django.db import transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from .decorators import is_file_present, is_my_file, is_share_present, is_file_not_already_shared, has_file_access, is_link_token_valid, is_upload_session_present
+from .models import File, FileShare, ShareableLink, UploadSession, UploadChunk
+from .serializers import FileSerializer, FileUploadSerializer, FileShareCreateSerializer, UploadSessionCreateSerializer, FileIdListSerializer
+from .serializers import FILE_LIST_FIELDS, FILE_SHARE_LIST_FIELDS, SHARED_FILE_LIST_FIELDS, serialize_file_rows, serialize_file_share_rows, serialize_shared_file_rows
+from .storage import blob_full_path, hash_blob, new_blob_path, new_staging_path, remove_blob
+from .deletion import delete_files
+from .pagination import InvalidCursor, get_page_size, is_paginated, keyset_page, paginate_keyset
+from .search import search_files
+from .quotas import effective_quota, get_usage, has_room_for, reserve_storage, room_left
+from .etags import file_etag, list_etag, etag_matches, not_modified
+from .versions import bump_list_versions, get_list_version
+from .upload_handlers import FileTooLarge, QuotaExceeded, discard_uploads, parse_uploads
+from .streaming import iter_zip, offloaded_file_response, ranged_file_response
 import base64
 from django.utils import timezone
 from datetime import timedelta
 from users.constants import ROLE_ADMIN, ROLE_USER, ROLE_GUEST
 from users.constants import PERM_VIEW, PERM_DOWNLOAD
 from utils.error_handling import format_serializer_errors
+from utils.sanitize import sanitize_input
 
 @api_view(['GET'])
 @jwt_required
 @mfa_enabled
 @role_required(ROLE_ADMIN, ROLE_USER)  
 def list_files(request):
-    files = File.objects.filter(uploaded_by=request.user)
-    serializer = FileSerializer(files, many=True)
-    return Response(serializer.data)
+    # Answer polling clients from the version counter alone when nothing changed
+    etag = list_etag(request.user, get_list_version(request.user.username))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    files = File.objects.filter(uploaded_by_id=request.user.id).values(*FILE_LIST_FIELDS)
+    if is_paginated(request):
+        try:
+            files, next_cursor = paginate_keyset(files, request)
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': serialize_file_rows(files), 'next_cursor': next_cursor}, headers={'ETag': etag})
+
+    return Response(serialize_file_rows(files), headers={'ETag': etag})
 
 @api_view(['POST'])
 @jwt_required
 @mfa_enabled
 @role_required(ROLE_ADMIN, ROLE_USER)  
 def upload_file(request):
+    content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    if content_length > settings.UPLOAD_MAX_FILE_SIZE:
+        return Response({'error': 'File is too large'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    # Write the file part straight to its blob path while the body is parsed. The quota
+    # is checked against the file part, the body also holds the other fields and boundaries.
+    try:
+        parse_uploads(request, room_left(request.user.id))
+    except FileTooLarge:
+        return Response({'error': 'File is too large'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    except QuotaExceeded:
+        return Response({'error': 'Storage quota exceeded'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
     serializer = FileUploadSerializer(data=request.data)
     if not serializer.is_valid():
+        discard_uploads(request)
         return Response(
             {'error': format_serializer_errors(serializer.errors)},
             status=status.HTTP_400_BAD_REQUEST
         )
-    # Create upload directory if it doesn't exist
-    upload_path = os.path.join(settings.BASE_DIR, settings.UPLOAD_DIR)
-    os.makedirs(upload_path, exist_ok=True)
-
-    # Generate unique filename
     file_obj = request.FILES['file']
-    unique_filename = f"{uuid.uuid4()}{os.path.splitext(file_obj.name)[1]}"
-    file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
-    full_path = os.path.join(settings.BASE_DIR, file_path)
+    with transaction.atomic():
+        if not reserve_storage(request.user.id, file_obj.size):
+            discard_uploads(request)
+            return Response({'error': 'Storage quota exceeded'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        file_path = file_obj.commit()
+
+        # Create file record
+        File.objects.create(
+            file_name=serializer.validated_data['file_name'],
+            file_path=file_path,
+            encrypted_key=serializer.validated_data['encrypted_key'],
+            size=file_obj.size,
+            sha256=file_obj.sha256,
+            uploaded_by_id=request.user.id
+        )
+        bump_list_versions([request.user.username])
+    return Response({'message': 'File uploaded successfully'}, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER)
+def upload_files_batch(request):
+    """Upload many files in one multipart body of repeated file/file_name/encrypted_key parts"""
+    try:
+        parse_uploads(request, room_left(request.user.id))
+    except TooManyFilesSent:
+        # DATA_UPLOAD_MAX_NUMBER_FILES is BULK_MAX_FILES, the parser stops at the first file over it
+        return Response(
+            {'error': f'At most {settings.BULK_MAX_FILES} files can be uploaded at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except FileTooLarge:
+        return Response({'error': 'File is too large'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    except QuotaExceeded:
+        return Response({'error': 'Storage quota exceeded'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    uploads = request.FILES.getlist('file')
+    file_names = request.data.getlist('file_name')
+    encrypted_keys = request.data.getlist('encrypted_key')
+
+    if not uploads or not len(uploads) == len(file_names) == len(encrypted_keys):
+        discard_uploads(request)
+        return Response(
+            {'error': 'Each file needs a file_name and an encrypted_key'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    validated = []
+    for index, item in enumerate(zip(uploads, file_names, encrypted_keys)):
+        serializer = FileUploadSerializer(data=dict(zip(('file', 'file_name', 'encrypted_key'), item)))
+        if not serializer.is_valid():
+            discard_uploads(request)
+            return Response(
+                {'error': f'File {index}: {format_serializer_errors(serializer.errors)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        validated.append(serializer.validated_data)
+
+    with transaction.atomic():
+        if not reserve_storage(request.user.id, sum(file_obj.size for file_obj in uploads), len(uploads)):
+            discard_uploads(request)
+            return Response({'error': 'Storage quota exceeded'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        file_paths = [file_obj.commit() for file_obj in uploads]
+        try:
+            files = File.objects.bulk_create([
+                File(
+                    file_name=data['file_name'],
+                    file_path=file_path,
+                    encrypted_key=data['encrypted_key'],
+                    size=file_obj.size,
+                    sha256=file_obj.sha256,
+                    uploaded_by_id=request.user.id
+                )
+                for data, file_obj, file_path in zip(validated, uploads, file_paths)
+            ])
+        except Exception:
+            for file_path in file_paths:
+                remove_blob(file_path)
+            raise
+        bump_list_versions([request.user.username])
+
+    return Response(
+        {'message': f'{len(files)} files uploaded successfully', 'file_ids': [file.id for file in files]},
+        status=status.HTTP_201_CREATED
+    )
+
+@api_view(['GET'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER)
+def get_storage_usage(request):
+    usage = get_usage(request.user.id)
+    quota = effective_quota(usage)
+    return Response({
+        'bytes_used': usage.bytes_used,
+        'file_count': usage.file_count,
+        'quota_bytes': quota,
+        'bytes_available': None if quota is None else max(quota - usage.bytes_used, 0)
+    })
+
+@api_view(['POST'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER)
+def create_upload_session(request):
+    """Start a resumable upload, chunks can then be sent in any order"""
+    serializer = UploadSessionCreateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(
+            {'error': format_serializer_errors(serializer.errors)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    total_size = serializer.validated_data['total_size']
+    if not has_room_for(request.user.id, total_size):
+        return Response({'error': 'Storage quota exceeded'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    staging_path = new_staging_path()
 
-    # Save file
-    with open(full_path, 'wb+') as destination:
-        for chunk in file_obj.chunks():
-            destination.write(chunk)
+    # Pre-size the staging file so chunks can be written at their offsets
+    with open(blob_full_path(staging_path), 'wb') as staging:
+        staging.truncate(total_size)
 
-    # Create file record
-    File.objects.create(
+    upload_session = UploadSession.objects.create(
         file_name=serializer.validated_data['file_name'],
-        file_path=file_path,
         encrypted_key=serializer.validated_data['encrypted_key'],
-        uploaded_by=request.user
+        total_size=total_size,
+        chunk_size=serializer.validated_data.get('chunk_size', settings.UPLOAD_CHUNK_SIZE),
+        staging_path=staging_path,
+        created_by_id=request.user.id,
+        expiration_time=timezone.now() + timedelta(hours=settings.UPLOAD_SESSION_EXPIRATION_HOURS)
     )
-    return Response({'message': 'File uploaded successfully'}, status=status.HTTP_201_CREATED)
+    return Response({
+        'upload_id': upload_session.id,
+        'chunk_size': upload_session.chunk_size,
+        'total_chunks': upload_session.total_chunks,
+        'expiration_time': upload_session.expiration_time
+    }, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER)
+@is_upload_session_present
+def get_upload_session(request, upload_id):
+    """Report which chunks have been received so an interrupted upload can resume"""
+    upload_session = request.upload_session
+    received_chunks = list(upload_session.chunks.values_list('index', flat=True))
+    return Response({
+        'upload_id': upload_session.id,
+        'file_name': upload_session.file_name,
+        'total_size': upload_session.total_size,
+        'chunk_size': upload_session.chunk_size,
+        'total_chunks': upload_session.total_chunks,
+        'received_chunks': received_chunks,
+        'expiration_time': upload_session.expiration_time
+    })
+
+@api_view(['PUT'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER)
+@is_upload_session_present
+def upload_chunk(request, upload_id, chunk_index):
+    """Write the raw request body as chunk `chunk_index` of the upload"""
+    upload_session = request.upload_session
+    if chunk_index >= upload_session.total_chunks:
+        return Response({'error': 'Invalid chunk index'}, status=status.HTTP_400_BAD_REQUEST)
+
+    offset, length = upload_session.chunk_bounds(chunk_index)
+    if request.META.get('CONTENT_LENGTH') != str(length):
+        return Response(
+            {'error': f'Chunk {chunk_index} must be exactly {length} bytes'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Stream the body straight to its offset, parallel chunks use their own descriptors
+    fd = os.open(blob_full_path(upload_session.staging_path), os.O_WRONLY)
+    try:
+        received = 0
+        while received < length:
+            data = request.read(min(settings.DOWNLOAD_CHUNK_SIZE, length - received))
+            if not data:
+                break
+            os.pwrite(fd, data, offset + received)
+            received += len(data)
+    finally:
+        os.close(fd)
+
+    if received != length:
+        return Response(
+            {'error': f'Chunk {chunk_index} is incomplete'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    # Parallel re-sends of a chunk may both get here, the first one records it
+    UploadChunk.objects.bulk_create([UploadChunk(session=upload_session, index=chunk_index)], ignore_conflicts=True)
+    return Response({'index': chunk_index})
+
+@api_view(['POST'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER)
+@is_upload_session_present
+def commit_upload_session(request, upload_id):
+    """Turn a fully received upload session into a File"""
+    upload_session = request.upload_session
+    received = upload_session.chunks.count()
+    if received != upload_session.total_chunks:
+        return Response(
+            {'error': f'{upload_session.total_chunks - received} chunks are missing'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Chunks arrive out of order, so the digest is computed once all bytes are in place
+    try:
+        size, sha256 = hash_blob(upload_session.staging_path)
+    except FileNotFoundError:
+        # Committed by a concurrent request meanwhile
+        return Response({'error': 'Upload session not found'}, status=status.HTTP_404_NOT_FOUND)
+    file_path = new_blob_path()
+    try:
+        with transaction.atomic():
+            if not reserve_storage(request.user.id, size):
+                return Response({'error': 'Storage quota exceeded'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            # Claim the session, a concurrent commit of it finds nothing left to delete
+            deleted, _ = UploadSession.objects.filter(id=upload_session.id).delete()
+            if not deleted:
+                transaction.set_rollback(True)
+                return Response({'error': 'Upload session not found'}, status=status.HTTP_404_NOT_FOUND)
+            file = File.objects.create(
+                file_name=upload_session.file_name,
+                file_path=file_path,
+                encrypted_key=upload_session.encrypted_key,
+                size=size,
+                sha256=sha256,
+                uploaded_by_id=request.user.id
+            )
+            bump_list_versions([request.user.username])
+            # Moved last, so only the commit itself can fail after it
+            os.replace(blob_full_path(upload_session.staging_path), blob_full_path(file_path))
+    except Exception:
+        # The session is restored by the rollback, and its staging file with it
+        if os.path.exists(blob_full_path(file_path)):
+            os.replace(blob_full_path(file_path), blob_full_path(upload_session.staging_path))
+        raise
+    return Response(
+        {'message': 'File uploaded successfully', 'file_id': file.id},
+        status=status.HTTP_201_CREATED
+    )
+
+@api_view(['DELETE'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER)
+@is_upload_session_present
+def delete_upload_session(request, upload_id):
+    remove_blob(request.upload_session.staging_path)
+    request.upload_session.delete()
+    return Response({'message': 'Upload cancelled'})
 
 @api_view(['GET'])
 @jwt_required
@@ -66,8 +340,11 @@ def upload_file(request):
 @is_file_present
 @has_file_access()
 def get_file_details(request, file_id):
+    etag = file_etag(request.file, 'details')
+    if etag_matches(request, etag):
+        return not_modified(etag)
     serializer = FileSerializer(request.file)
-    return Response(serializer.data)
+    return Response(serializer.data, headers={'ETag': etag} if etag else None)
 
 @api_view(['POST'])
 @jwt_required
@@ -77,15 +354,142 @@ def get_file_details(request, file_id):
 @has_file_access('DOWNLOAD')
 def download_file(request, file_id):
     file = request.file
+    etag = file_etag(file, 'json')
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     # Read the encrypted file and convert to base64
-    with open(os.path.join(settings.BASE_DIR, file.file_path), 'rb') as f:
+    with open(blob_full_path(file.file_path), 'rb') as f:
         encrypted_content = base64.b64encode(f.read()).decode('utf-8')
     
     return Response({
         'file_name': file.file_name,
         'encrypted_content': encrypted_content,
         'encrypted_key': file.encrypted_key
-    })
+    }, headers={'ETag': etag} if etag else None)
+
+@api_view(['GET'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER, ROLE_GUEST)
+@is_file_present
+@has_file_access('DOWNLOAD')
+def download_file_raw(request, file_id):
+    """Stream the encrypted file as raw bytes, with its metadata sent as headers.
+    Supports Range/If-Range so interrupted downloads can be resumed."""
+    file = request.file
+    etag = file_etag(file)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    try:
+        response = (
+            offloaded_file_response(request, file.file_path, etag=etag, filename=file.file_name)
+            or ranged_file_response(request, blob_full_path(file.file_path), etag=etag, filename=file.file_name)
+        )
+    except FileNotFoundError:
+        return Response(
+            {'error': 'File content not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    response['X-File-Name'] = quote(file.file_name)
+    response['X-Encrypted-Key'] = file.encrypted_key
+    return response
+
+@api_view(['POST'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER, ROLE_GUEST)
+def download_files_zip(request):
+    """Stream several encrypted files as one ZIP, with their encrypted keys in manifest.json"""
+    serializer = FileIdListSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(
+            {'error': format_serializer_errors(serializer.errors)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    file_ids = serializer.validated_data['file_ids']
+
+    # Authorize every file in one query: owned, or shared with DOWNLOAD permission
+    downloadable_shares = FileShare.objects.filter(
+        shared_with_username=request.user.username,
+        permission_type=PERM_DOWNLOAD
+    ).values('file_id')
+    files = list(
+        File.objects.filter(id__in=file_ids)
+        .filter(Q(uploaded_by_id=request.user.id) | Q(id__in=downloadable_shares))
+        .select_related('uploaded_by')
+        .only('id', 'file_name', 'file_path', 'encrypted_key', 'sha256', 'created_at', 'uploaded_by__username')
+    )
+    denied = sorted(set(file_ids) - {file.id for file in files})
+    if denied:
+        return Response(
+            {'error': 'Access denied', 'file_ids': denied},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    entries = []
+    manifest = []
+    position = {file_id: index for index, file_id in enumerate(file_ids)}
+    for file in sorted(files, key=lambda file: position[file.id]):
+        # Prefix with the id so equal names don't collide, and keep entries flat
+        arcname = f"{file.id}_" + file.file_name.replace('/', '_').replace('\\', '_')
+        entries.append((arcname, blob_full_path(file.file_path), file.created_at.timetuple()[:6]))
+        manifest.append({
+            'file_id': file.id,
+            'file_name': file.file_name,
+            'path': arcname,
+            'encrypted_key': file.encrypted_key,
+            'key_owner_username': file.uploaded_by.username,
+            'sha256': file.sha256
+        })
+
+    missing = [entry[0] for entry in entries if not os.path.exists(entry[1])]
+    if missing:
+        return Response(
+            {'error': 'File content not found', 'files': missing},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    response = StreamingHttpResponse(
+        iter_zip(entries, manifest, settings.DOWNLOAD_CHUNK_SIZE),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = 'attachment; filename="files.zip"'
+    return response
+
+@api_view(['DELETE'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER)
+@is_file_present
+@is_my_file
+def delete_file(request, file_id):
+    delete_files([file_id])
+    return Response({'message': 'File deleted successfully'})
+
+@api_view(['POST'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER)
+def delete_files_bulk(request):
+    serializer = FileIdListSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(
+            {'error': format_serializer_errors(serializer.errors)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    file_ids = serializer.validated_data['file_ids']
+
+    owned = set(File.objects.filter(id__in=file_ids, uploaded_by_id=request.user.id).values_list('id', flat=True))
+    denied = sorted(set(file_ids) - owned)
+    if denied:
+        return Response(
+            {'error': 'Access denied', 'file_ids': denied},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    deleted = delete_files(file_ids)
+    return Response({'message': f'{deleted} files deleted successfully'})
 
 @api_view(['GET'])
 @jwt_required
@@ -94,9 +498,8 @@ def download_file(request, file_id):
 @is_file_present
 @is_my_file
 def list_file_shares(request, file_id):
-    shares = FileShare.objects.filter(file_id=file_id)
-    serializer = FileShareSerializer(shares, many=True)
-    return Response(serializer.data)
+    shares = FileShare.objects.filter(file_id=file_id).values(*FILE_SHARE_LIST_FIELDS)
+    return Response(serialize_file_share_rows(shares))
 
 @api_view(['POST'])
 @jwt_required
@@ -114,12 +517,14 @@ def add_share(request, file_id):
         )
     if serializer.validated_data['permission_type'] not in [PERM_VIEW, PERM_DOWNLOAD]:
         return Response({'error': 'Invalid permission type'}, status=status.HTTP_400_BAD_REQUEST)
-    FileShare.objects.create(
-        file=request.file,
-        shared_with_username=serializer.validated_data['shared_with_username'],
-        permission_type=serializer.validated_data['permission_type'],
-        shared_by=request.user
-    )
+    with transaction.atomic():
+        FileShare.objects.create(
+            file=request.file,
+            shared_with_username=serializer.validated_data['shared_with_username'],
+            permission_type=serializer.validated_data['permission_type'],
+            shared_by_id=request.user.id
+        )
+        bump_list_versions([request.user.username, serializer.validated_data['shared_with_username']])
     return Response(status=status.HTTP_201_CREATED)
 
 @api_view(['PUT'])
@@ -133,7 +538,9 @@ def update_share(request, file_id, share_id):
     serializer = FileShareCreateSerializer(data=request.data, partial=True)
     if serializer.is_valid():
         request.share.permission_type = serializer.validated_data.get('permission_type', request.share.permission_type)
-        request.share.save()
+        with transaction.atomic():
+            request.share.save(update_fields=['permission_type'])
+            bump_list_versions([request.user.username, request.share.shared_with_username])
         return Response({'message': 'Share updated successfully'})
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -145,7 +552,9 @@ def update_share(request, file_id, share_id):
 @is_my_file
 @is_share_present
 def delete_share(request, file_id, share_id):
-    request.share.delete()
+    with transaction.atomic():
+        request.share.delete()
+        bump_list_versions([request.user.username, request.share.shared_with_username])
     return Response({'message': 'Share deleted successfully'})
 
 @api_view(['GET'])
@@ -154,12 +563,86 @@ def delete_share(request, file_id, share_id):
 @role_required(ROLE_ADMIN, ROLE_USER, ROLE_GUEST)
 def list_my_shares(request):
     """Get list of files shared with the current user"""
+    etag = list_etag(request.user, get_list_version(request.user.username))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     shares = FileShare.objects.filter(
         shared_with_username=request.user.username
-    ).select_related('file', 'file__uploaded_by', 'shared_by')
+    ).values(*SHARED_FILE_LIST_FIELDS)
+
+    if is_paginated(request):
+        try:
+            shares, next_cursor = paginate_keyset(shares, request)
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': serialize_shared_file_rows(shares), 'next_cursor': next_cursor}, headers={'ETag': etag})
     
-    serializer = SharedFileSerializer(shares, many=True)
-    return Response(serializer.data)
+    return Response(serialize_shared_file_rows(shares), headers={'ETag': etag})
+
+@api_view(['GET'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER, ROLE_GUEST)
+def get_dashboard(request):
+    """
+    Everything the dashboard needs on load in one round trip: user info and the
+    first page and count of owned and shared-with-me files, in a fixed number of queries.
+    Further pages come from files/list and files/shares/me with the returned cursors.
+    """
+    user = request.user
+    page_size = get_page_size(request)
+
+    # Guests cannot upload, so they own no files
+    owned_files, owned_cursor, owned_count = [], None, 0
+    if user.role in (ROLE_ADMIN, ROLE_USER):
+        owned_files, owned_cursor = keyset_page(
+            File.objects.filter(uploaded_by_id=user.id).values(*FILE_LIST_FIELDS),
+            page_size
+        )
+        owned_count = get_usage(user.id).file_count
+
+    shares = FileShare.objects.filter(shared_with_username=user.username)
+    shared_files, shared_cursor = keyset_page(shares.values(*SHARED_FILE_LIST_FIELDS), page_size)
+    # A page that ends the list already holds the whole count
+    shared_count = len(shared_files) if shared_cursor is None else shares.count()
+
+    return Response({
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'role': user.role,
+            'created_at': user.created_at
+        },
+        'files': {
+            'results': serialize_file_rows(owned_files),
+            'next_cursor': owned_cursor,
+            'count': owned_count
+        },
+        'shared_files': {
+            'results': serialize_shared_file_rows(shared_files),
+            'next_cursor': shared_cursor,
+            'count': shared_count
+        }
+    })
+
+@api_view(['GET'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN, ROLE_USER, ROLE_GUEST)
+def search_files_view(request):
+    """Search names of owned and shared-with-me files"""
+    query = sanitize_input(request.query_params.get('q', ''), allow_spaces=True)
+    if not query:
+        return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    files, has_more = search_files(request.user, query, page, get_page_size(request))
+    serializer = FileSerializer(files, many=True)
+    return Response({'results': serializer.data, 'page': page, 'has_more': has_more})
 
 @api_view(['GET'])
 @jwt_required
@@ -171,19 +654,14 @@ def get_file_permission(request, file_id):
     """
     Get user's permission for a specific file
     """
-    if request.file.uploaded_by_id == request.user.id:
+    if request.file_access.is_owner:
         return Response({
             'is_owner': True
         })
     
-    share = FileShare.objects.get(
-        file_id=file_id,
-        shared_with_username=request.user.username
-    )
-    
     return Response({
         'is_owner': False,
-        'permission_type': share.permission_type
+        'permission_type': request.file_access.share_permission
     })
 
 @api_view(['POST'])
@@ -199,11 +677,13 @@ def generate_link(request, file_id):
         expiration_time = timezone.now() + timedelta(minutes=expiration_minutes)
 
         # Create new shareable link
-        link = ShareableLink.objects.create(
-            file=request.file,
-            created_by=request.user,
-            expiration_time=expiration_time
-        )
+        with transaction.atomic():
+            link = ShareableLink.objects.create(
+                file=request.file,
+                created_by_id=request.user.id,
+                expiration_time=expiration_time
+            )
+            bump_list_versions([request.user.username])
         
         return Response({
             'token': link.token,
@@ -8,7 +8,7 @@ def key_exists(view_func):
     @wraps(view_func)
     def wrapped(request, *args, **kwargs):
         try:
-            KeyPair.objects.get(username=request.data.get('key_owner_username', request.user.username))
+            request.key_pair = KeyPair.objects.get(username=request.data.get('key_owner_username', request.user.username))
             return view_func(request, *args, **kwargs)
         except KeyPair.DoesNotExist:
             return Response(
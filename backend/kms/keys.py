@@ -0,0 +1,37 @@
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+from utils.lru import LRUCache
+
+# Loaded keys hold the CRT parameters and Montgomery contexts, a few times the size of the PEM
+LOADED_KEY_BYTES_PER_PEM_BYTE = 4
+
+private_key_cache = LRUCache(
+    settings.KMS_KEY_CACHE_SIZE,
+    settings.KMS_KEY_CACHE_TTL_SECONDS,
+    max_weight=settings.KMS_KEY_CACHE_MAX_BYTES
+)
+
+
+def key_cache_key(key_pair):
+    # created_at tells a replaced key pair apart even if the id were reused
+    return (key_pair.id, key_pair.created_at)
+
+
+def load_private_key(key_pair):
+    """The key pair's RSAPrivateKey, parsed from its PEM once and then cached"""
+    cache_key = key_cache_key(key_pair)
+    private_key = private_key_cache.get(cache_key)
+    if private_key is None:
+        private_pem = key_pair.private_key.encode()
+        private_key = serialization.load_pem_private_key(
+            private_pem,
+            password=None,
+            backend=default_backend()
+        )
+        private_key_cache.set(cache_key, private_key, weight=len(private_pem) * LOADED_KEY_BYTES_PER_PEM_BYTE)
+    return private_key
+
+
+def evict_private_key(key_pair):
+    private_key_cache.pop(key_cache_key(key_pair))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class DecryptItemSerializer(serializers.Serializer):
+    encrypted = serializers.CharField()
+    key_owner_username = serializers.CharField(max_length=150, required=False)
+
+
+class DecryptBatchSerializer(serializers.Serializer):
+    items = serializers.ListField(child=DecryptItemSerializer(), allow_empty=False)
+
+    def validate_items(self, value):
+        if len(value) > settings.BULK_MAX_FILES:
+            raise serializers.ValidationError(f"At most {settings.BULK_MAX_FILES} items can be decrypted at once.")
+        return value
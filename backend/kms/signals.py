@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .keys import evict_private_key
+from .models import KeyPair
+
+
+@receiver(post_save, sender=KeyPair)
+@receiver(post_delete, sender=KeyPair)
+def drop_cached_private_key(sender, instance, **kwargs):
+    evict_private_key(instance)
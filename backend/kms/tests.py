@@ -1,3 +1,219 @@
-from django.test import TestCase
+import base64
+from unittest import mock
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from users.constants import ROLE_ADMIN
+from utils.testing import QueryBudgetTestCase
+from . import keys
+from .models import KeyAccess, KeyPair
+from .views import generate_key_pair
 
-# Create your tests here.
+
+class KmsQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user('owner')
+        self.reader = self.create_user('reader')
+        self.authenticate(self.reader)
+        public_key, private_key = generate_key_pair()
+        self.key_pair = KeyPair.objects.create(username=self.owner.username, public_key=public_key, private_key=private_key)
+        self.seeded = 0
+
+    def add_key_rows(self, count):
+        """Other users' key pairs and access grants, to check nothing scans them"""
+        usernames = [f'other-{index}' for index in range(self.seeded, self.seeded + count)]
+        KeyPair.objects.bulk_create(
+            KeyPair(username=username, public_key=self.key_pair.public_key, private_key=self.key_pair.private_key)
+            for username in usernames
+        )
+        KeyAccess.objects.bulk_create(
+            KeyAccess(key_owner_username=username, shared_with_username=self.reader.username) for username in usernames
+        )
+        self.seeded += count
+        return usernames
+
+    def encrypt(self, plaintext):
+        public_key = serialization.load_pem_public_key(self.key_pair.public_key.encode())
+        encrypted = public_key.encrypt(
+            plaintext,
+            padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+        )
+        return base64.b64encode(encrypted).decode()
+
+    def test_get_existing_key(self):
+        self.authenticate(self.owner)
+        self.assertQueryBudget(1, self.add_key_rows, lambda _: self.client.post('/kms/key'))
+
+    def test_create_key(self):
+        def seed(count):
+            self.add_key_rows(count)
+            KeyPair.objects.filter(username=self.reader.username).delete()
+
+        self.assertQueryBudget(2, seed, lambda _: self.client.post('/kms/key'))
+
+    def test_decrypt_with_granted_key(self):
+        KeyAccess.objects.create(key_owner_username=self.owner.username, shared_with_username=self.reader.username)
+        encrypted = self.encrypt(b'file key')
+        self.assertQueryBudget(
+            2,
+            self.add_key_rows,
+            lambda _: self.client.post(
+                '/kms/decrypt', {'encrypted': encrypted, 'key_owner_username': self.owner.username}, content_type='application/json'
+            )
+        )
+
+    def test_decrypt_batch(self):
+        # One item per key owner, so anything looked up per owner shows
+        items = []
+
+        def seed(count):
+            encrypted = self.encrypt(b'file key')
+            items.extend({'encrypted': encrypted, 'key_owner_username': username} for username in self.add_key_rows(count))
+            return items
+
+        # Every owner has the same key, parse it once to keep a thousand validations out of the test
+        private_key = serialization.load_pem_private_key(self.key_pair.private_key.encode(), password=None)
+        with mock.patch.object(keys.serialization, 'load_pem_private_key', return_value=private_key):
+            self.assertQueryBudget(
+                1,
+                seed,
+                lambda items: self.client.post('/kms/decrypt/batch', {'items': items}, content_type='application/json')
+            )
+
+    def test_grant_access(self):
+        self.authenticate(self.owner)
+
+        def seed(count):
+            self.add_key_rows(count)
+            KeyAccess.objects.filter(key_owner_username=self.owner.username).delete()
+
+        self.assertQueryBudget(
+            5,
+            seed,
+            lambda _: self.client.post('/kms/access/grant', {'username': self.reader.username}, content_type='application/json')
+        )
+
+    def test_revoke_access(self):
+        self.authenticate(self.owner)
+
+        def seed(count):
+            self.add_key_rows(count)
+            KeyAccess.objects.get_or_create(key_owner_username=self.owner.username, shared_with_username=self.reader.username)
+
+        self.assertQueryBudget(
+            1,
+            seed,
+            lambda _: self.client.post('/kms/access/revoke', {'username': self.reader.username}, content_type='application/json')
+        )
+
+    def test_key_cache_stats(self):
+        self.authenticate(self.create_user('admin', role=ROLE_ADMIN))
+        self.assertQueryBudget(0, self.add_key_rows, lambda _: self.client.get('/kms/cache/stats'))
+
+
+class PrivateKeyCacheTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = self.create_user('owner')
+        self.authenticate(self.owner)
+        public_key, private_key = generate_key_pair()
+        self.key_pair = KeyPair.objects.create(username=self.owner.username, public_key=public_key, private_key=private_key)
+
+    def decrypt(self, plaintext):
+        public_key = serialization.load_pem_public_key(self.key_pair.public_key.encode())
+        encrypted = public_key.encrypt(
+            plaintext,
+            padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+        )
+        response = self.client.post('/kms/decrypt', {'encrypted': base64.b64encode(encrypted).decode()}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return base64.b64decode(response.json()['decrypted'])
+
+    def test_private_key_is_parsed_once(self):
+        parse = serialization.load_pem_private_key
+        before = keys.private_key_cache.stats()
+        with mock.patch.object(keys.serialization, 'load_pem_private_key', wraps=parse) as load:
+            self.assertEqual(self.decrypt(b'first'), b'first')
+            self.assertEqual(self.decrypt(b'second'), b'second')
+        load.assert_called_once()
+        after = keys.private_key_cache.stats()
+        self.assertEqual(after['size'], 1)
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 1))
+
+    def test_replaced_key_pair_is_not_served_from_the_cache(self):
+        self.decrypt(b'file key')
+        public_key, private_key = generate_key_pair()
+        self.key_pair.public_key, self.key_pair.private_key = public_key, private_key
+        self.key_pair.save()
+        self.assertEqual(len(keys.private_key_cache), 0)
+        self.assertEqual(self.decrypt(b'file key'), b'file key')
+
+    def test_cache_is_capped_by_memory(self):
+        cache_key = keys.key_cache_key(self.key_pair)
+        evictions = keys.private_key_cache.evictions
+        with mock.patch.object(keys.private_key_cache, 'max_weight', 1):
+            self.decrypt(b'file key')
+        self.assertEqual(len(keys.private_key_cache), 0)
+        keys.private_key_cache.set(('other', None), object(), weight=keys.private_key_cache.max_weight)
+        self.decrypt(b'file key')
+        self.assertIsNone(keys.private_key_cache.get(('other', None)))
+        self.assertIsNotNone(keys.private_key_cache.get(cache_key))
+        self.assertEqual(keys.private_key_cache.evictions - evictions, 1)
+
+    def test_stats_are_for_admins(self):
+        self.assertEqual(self.client.get('/kms/cache/stats').status_code, 403)
+        self.authenticate(self.create_user('root', role=ROLE_ADMIN))
+        response = self.client.get('/kms/cache/stats')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'size', 'max_size', 'weight', 'max_weight', 'hits', 'misses', 'evictions'})
+
+
+class DecryptBatchTests(QueryBudgetTestCase):
+    def test_results_are_per_item(self):
+        owner = self.create_user('owner')
+        stranger = self.create_user('stranger')
+        reader = self.create_user('reader')
+        self.authenticate(reader)
+        public_keys = {}
+        for user in (owner, stranger, reader):
+            public_key, private_key = generate_key_pair()
+            KeyPair.objects.create(username=user.username, public_key=public_key, private_key=private_key)
+            public_keys[user.username] = serialization.load_pem_public_key(public_key.encode())
+        KeyAccess.objects.create(key_owner_username=owner.username, shared_with_username=reader.username)
+
+        def encrypt(username, plaintext):
+            encrypted = public_keys[username].encrypt(
+                plaintext,
+                padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+            )
+            return base64.b64encode(encrypted).decode()
+
+        items = [
+            {'encrypted': encrypt('owner', b'shared'), 'key_owner_username': 'owner'},
+            {'encrypted': encrypt('reader', b'mine')},
+            {'encrypted': encrypt('stranger', b'secret'), 'key_owner_username': 'stranger'},
+            {'encrypted': encrypt('owner', b'shared'), 'key_owner_username': 'nobody'},
+            {'encrypted': encrypt('reader', b'mine'), 'key_owner_username': 'owner'},
+        ]
+        with (
+            mock.patch.object(keys.serialization, 'load_pem_private_key', wraps=serialization.load_pem_private_key) as load,
+            self.assertLogs('kms.views', 'ERROR') as logs
+        ):
+            response = self.client.post('/kms/decrypt/batch', {'items': items}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'decrypted': base64.b64encode(b'shared').decode()},
+            {'decrypted': base64.b64encode(b'mine').decode()},
+            {'error': 'No access to this key'},
+            {'error': 'No key pair found for user'},
+            {'error': 'Decryption failed'},
+        ])
+        self.assertEqual(load.call_count, 2)
+        self.assertEqual(len(logs.records), 1)
+
+    def test_batch_size_is_limited(self):
+        self.authenticate(self.create_user('reader'))
+        for items in ([], [{'encrypted': 'x'}] * 3):
+            with self.subTest(items=len(items)), self.settings(BULK_MAX_FILES=2):
+                response = self.client.post('/kms/decrypt/batch', {'items': items}, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
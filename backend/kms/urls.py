@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path('key', views.create_or_get_key, name='create-or-get-key'),
     path('decrypt', views.decrypt_string, name='decrypt-string'),
+    path('decrypt/batch', views.decrypt_batch, name='decrypt-batch'),
     path('access/grant', views.grant_access, name='grant-access'),
     path('access/revoke', views.revoke_access, name='revoke-access'),
+    path('cache/stats', views.key_cache_stats, name='key-cache-stats'),
 ] 
\ No newline at end of file
@@ -2,14 +2,22 @@ from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from users.decorators import jwt_required, mfa_enabled
+from users.decorators import jwt_required, mfa_enabled, role_required
+from users.constants import ROLE_ADMIN
 from .decorators import key_exists
+from .keys import load_private_key, private_key_cache
+from .serializers import DecryptBatchSerializer
 from .models import KeyPair, KeyAccess
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.backends import default_backend
 import base64
+import logging
+from django.db.models import Q
 from users.models import User
+from utils.error_handling import format_serializer_errors
+
+logger = logging.getLogger(__name__)
 
 def generate_key_pair():
     private_key = rsa.generate_private_key(
@@ -48,6 +56,22 @@ def create_or_get_key(request):
         )
         return Response({'public_key': public_key})
 
+def decrypt_with(private_key, encrypted):
+    """Decrypt base64 OAEP ciphertext, returning the plaintext in base64"""
+    # The encrypted data is already in base64 format
+    encrypted_data = base64.b64decode(encrypted)
+    decrypted_data = private_key.decrypt(
+        encrypted_data,
+        padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            algorithm=hashes.SHA256(),
+            label=None
+        )
+    )
+
+    # Return the decrypted data in base64 format
+    return base64.b64encode(decrypted_data).decode('utf-8')
+
 @api_view(['POST'])
 @jwt_required
 @mfa_enabled
@@ -73,35 +97,60 @@ def decrypt_string(request):
                     status=status.HTTP_403_FORBIDDEN
                 )
         
-        key_pair = KeyPair.objects.get(username=key_owner_username)
-        private_key = serialization.load_pem_private_key(
-            key_pair.private_key.encode(),
-            password=None,
-            backend=default_backend()
-        )
-
-        # The encrypted data is already in base64 format
-        encrypted_data = base64.b64decode(request.data['encrypted'])
-        decrypted_data = private_key.decrypt(
-            encrypted_data,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-
-        # Return the decrypted data in base64 format
         return Response({
-            'decrypted': base64.b64encode(decrypted_data).decode('utf-8')
+            'decrypted': decrypt_with(load_private_key(request.key_pair), request.data['encrypted'])
         })
-    except Exception as e:
-        print(f"Decryption error: {str(e)}")  # Add better error logging
+    except Exception:
+        logger.exception('Decryption failed')
         return Response(
             {'error': 'Decryption failed'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
+@api_view(['POST'])
+@jwt_required
+@mfa_enabled
+def decrypt_batch(request):
+    """Decrypt several strings in one request, with a result or error per item in request order"""
+    serializer = DecryptBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(
+            {'error': format_serializer_errors(serializer.errors)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    items = serializer.validated_data['items']
+    owners = {item.get('key_owner_username', request.user.username) for item in items}
+
+    # Fetch the owners' key pairs and whether the user may use them in one query
+    granted_owners = KeyAccess.objects.filter(shared_with_username=request.user.username).values('key_owner_username')
+    key_pairs = {
+        key_pair.username: key_pair
+        for key_pair in KeyPair.objects.filter(username__in=owners).annotate(
+            has_access=Q(username=request.user.username) | Q(username__in=granted_owners)
+        )
+    }
+
+    private_keys = {}
+    results = []
+    for item in items:
+        owner = item.get('key_owner_username', request.user.username)
+        key_pair = key_pairs.get(owner)
+        if key_pair is None:
+            results.append({'error': 'No key pair found for user'})
+            continue
+        if not key_pair.has_access:
+            results.append({'error': 'No access to this key'})
+            continue
+        try:
+            if owner not in private_keys:
+                private_keys[owner] = load_private_key(key_pair)
+            results.append({'decrypted': decrypt_with(private_keys[owner], item['encrypted'])})
+        except Exception:
+            logger.exception('Decryption failed for key of %s', owner)
+            results.append({'error': 'Decryption failed'})
+
+    return Response({'results': results})
+
 @api_view(['POST'])
 @jwt_required
 @mfa_enabled
@@ -115,7 +164,7 @@ def grant_access(request):
     try:
         shared_with_user = User.objects.get(username=request.data['username'])
         # Prevent sharing with self
-        if shared_with_user == request.user:
+        if shared_with_user.id == request.user.id:
             return Response(
                 {'error': 'Cannot share key with yourself'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -153,3 +202,10 @@ def revoke_access(request):
             {},
             status=status.HTTP_400_BAD_REQUEST
         )
+
+@api_view(['GET'])
+@jwt_required
+@mfa_enabled
+@role_required(ROLE_ADMIN)
+def key_cache_stats(request):
+    return Response(private_key_cache.stats())
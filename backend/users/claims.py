@@ -0,0 +1,81 @@
+from collections import namedtuple
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from utils.lru import LRUCache
+from .models import User
+
+UserClaims = namedtuple('UserClaims', ['id', 'username', 'role', 'mfa_configured', 'created_at'])
+
+user_claims_cache = LRUCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL_SECONDS)
+
+
+def get_user_claims(user_id):
+    """The cached claims of a user, loaded with one narrow query on a miss. None if there is no such user."""
+    claims = user_claims_cache.get(user_id)
+    if claims is None:
+        row = (
+            User.objects.filter(id=user_id)
+            .values('id', 'username', 'role', 'mfa_secret', 'created_at')
+            .first()
+        )
+        if row is None:
+            return None
+        claims = UserClaims(
+            id=row['id'],
+            username=row['username'],
+            role=row['role'],
+            mfa_configured=bool(row['mfa_secret']),
+            created_at=row['created_at']
+        )
+        user_claims_cache.set(user_id, claims)
+    return claims
+
+
+def invalidate_user_claims(user_id):
+    user_claims_cache.pop(user_id)
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    request.user answering id, username, role, mfa_configured and created_at
+    from cached claims. Anything else (mfa_secret, save(), ...) loads the User.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, claims):
+        super().__init__(lambda: User.objects.get(id=claims.id))
+        self.__dict__['claims'] = claims
+
+    @property
+    def id(self):
+        return self.__dict__['claims'].id
+
+    pk = id
+
+    @property
+    def username(self):
+        return self.__dict__['claims'].username
+
+    @property
+    def role(self):
+        return self.__dict__['claims'].role
+
+    @property
+    def mfa_configured(self):
+        return self.__dict__['claims'].mfa_configured
+
+    @property
+    def created_at(self):
+        return self.__dict__['claims'].created_at
+
+
+def load_request_user(user_id):
+    """The user for an authenticated request. Raises User.DoesNotExist."""
+    if not settings.JWT_CLAIMS_AUTH:
+        return User.objects.get(id=user_id)
+    claims = get_user_claims(user_id)
+    if claims is None:
+        raise User.DoesNotExist
+    return ClaimsUser(claims)
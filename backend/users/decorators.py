@@ -4,7 +4,9 @@ import jwt
 from rest_framework.response import Response
 from rest_framework import status
 from .models import User
-from datetime import datetime, timezone
+from .claims import load_request_user
+from .refresh import refresh_access_token
+from .tokens import decode_token
 
 def jwt_required(view_func):
     @wraps(view_func)
@@ -21,16 +23,12 @@ def jwt_required(view_func):
 
         try:
             # Try to validate access token first
-            payload = jwt.decode(
-                access_token,
-                settings.JWT_SETTINGS['SIGNING_KEY'],
-                algorithms=[settings.JWT_SETTINGS['ALGORITHM']]
-            )
+            payload = decode_token(access_token)
             
             if payload['token_type'] != 'access':
                 raise jwt.InvalidTokenError
             
-            request.user = User.objects.get(id=payload['user_id'])
+            request.user = load_request_user(payload['user_id'])
             return view_func(request, *args, **kwargs)
             
         except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, TypeError):
@@ -42,31 +40,10 @@ def jwt_required(view_func):
                 )
             
             try:
-                # Validate refresh token
-                refresh_payload = jwt.decode(
-                    refresh_token,
-                    settings.JWT_SETTINGS['SIGNING_KEY'],
-                    algorithms=[settings.JWT_SETTINGS['ALGORITHM']]
-                )
-                
-                if refresh_payload['token_type'] != 'refresh':
-                    raise jwt.InvalidTokenError
-                
-                # Generate new access token
-                user = User.objects.get(id=refresh_payload['user_id'])
-                new_access_payload = {
-                    'user_id': user.id,
-                    'username': user.username,
-                    'role': user.role,
-                    'token_type': 'access',
-                    'exp': datetime.now(timezone.utc) + settings.JWT_SETTINGS['ACCESS_TOKEN_LIFETIME']
-                }
-                
-                new_access_token = jwt.encode(
-                    new_access_payload,
-                    settings.JWT_SETTINGS['SIGNING_KEY'],
-                    algorithm=settings.JWT_SETTINGS['ALGORITHM']
-                )
+                # Requests refreshing with the same token at once share one new access token
+                refreshed = refresh_access_token(refresh_token)
+                user = load_request_user(refreshed.user_id)
+                new_access_token = refreshed.access_token
                 
                 # Set new access token in request for response modification
                 request.new_access_token = new_access_token
@@ -108,7 +85,7 @@ def mfa_enabled(view_func):
     @wraps(view_func)
     def wrapped(request, *args, **kwargs):
         # Simply check if MFA is enabled
-        if request.user.mfa_secret:
+        if request.user.mfa_configured:
             response = view_func(request, *args, **kwargs)
             return response
             
@@ -123,7 +100,7 @@ def mfa_disabled(view_func):
     @wraps(view_func) 
     def wrapped(request, *args, **kwargs):
         # Simply check if MFA is disabled
-        if not request.user.mfa_secret:
+        if not request.user.mfa_configured:
             response = view_func(request, *args, **kwargs)
             return response
             
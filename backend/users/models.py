@@ -51,6 +51,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.username
 
+    @property
+    def mfa_configured(self):
+        return bool(self.mfa_secret)
+
     @property
     def is_staff(self):
         return self.role == ROLE_ADMIN
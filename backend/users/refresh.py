@@ -0,0 +1,85 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+import jwt
+from django.conf import settings
+from utils.lru import LRUCache
+from .claims import load_request_user
+
+# An access token minted from a refresh token, shared by the requests refreshing with it
+RefreshedToken = namedtuple('RefreshedToken', ['access_token', 'user_id', 'refresh_expires_at'])
+
+refreshed_tokens = LRUCache(settings.JWT_REFRESH_CACHE_SIZE, settings.JWT_REFRESH_GRACE_SECONDS)
+refresh_locks = {}
+refresh_locks_lock = threading.Lock()
+
+
+def refresh_token_key(refresh_token):
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+def mint_access_token(refresh_token):
+    """
+    Validate a refresh token and sign a new access token for its user.
+    Raises jwt.InvalidTokenError (or a subclass) and User.DoesNotExist.
+    """
+    refresh_payload = jwt.decode(
+        refresh_token,
+        settings.JWT_SETTINGS['SIGNING_KEY'],
+        algorithms=[settings.JWT_SETTINGS['ALGORITHM']]
+    )
+
+    if refresh_payload['token_type'] != 'refresh':
+        raise jwt.InvalidTokenError
+
+    user = load_request_user(refresh_payload['user_id'])
+    new_access_payload = {
+        'user_id': user.id,
+        'username': user.username,
+        'role': user.role,
+        'token_type': 'access',
+        'exp': datetime.now(timezone.utc) + settings.JWT_SETTINGS['ACCESS_TOKEN_LIFETIME']
+    }
+
+    new_access_token = jwt.encode(
+        new_access_payload,
+        settings.JWT_SETTINGS['SIGNING_KEY'],
+        algorithm=settings.JWT_SETTINGS['ALGORITHM']
+    )
+    return RefreshedToken(new_access_token, user.id, refresh_payload.get('exp', float('inf')))
+
+
+def cached_refresh(key):
+    refreshed = refreshed_tokens.get(key)
+    if refreshed is not None and refreshed.refresh_expires_at <= time.time():
+        return None
+    return refreshed
+
+
+def refresh_access_token(refresh_token):
+    """
+    The access token for a refresh token. Requests refreshing with the same token
+    at the same time wait for one of them to mint it, and requests within
+    JWT_REFRESH_GRACE_SECONDS after that reuse it. Raises like mint_access_token.
+    """
+    key = refresh_token_key(refresh_token)
+    refreshed = cached_refresh(key)
+    if refreshed is not None:
+        return refreshed
+
+    with refresh_locks_lock:
+        lock = refresh_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            # Another request may have minted it while we waited
+            refreshed = cached_refresh(key)
+            if refreshed is None:
+                refreshed = mint_access_token(refresh_token)
+                refreshed_tokens.set(key, refreshed)
+            return refreshed
+    finally:
+        with refresh_locks_lock:
+            if refresh_locks.get(key) is lock:
+                del refresh_locks[key]
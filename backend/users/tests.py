@@ -1,3 +1,179 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import jwt
+import pyotp
+from django.conf import settings
+from utils.testing import QueryBudgetTestCase
+from .constants import ROLE_GUEST, ROLE_USER
+from .models import User
+from . import refresh, tokens
 
-# Create your tests here.
+
+class UserQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('member')
+        self.authenticate(self.user)
+        self.seeded = 0
+
+    def add_users(self, count):
+        User.objects.bulk_create(
+            User(username=f'other-{index}', password='!') for index in range(self.seeded, self.seeded + count)
+        )
+        self.seeded += count
+
+    def test_register(self):
+        def seed(count):
+            self.add_users(count)
+            return f'newcomer{self.seeded}'
+
+        self.assertQueryBudget(
+            3,
+            seed,
+            lambda username: self.client.post(
+                '/users/auth/register', {'username': username, 'password': 'Query!budget123', 'role': ROLE_USER}, content_type='application/json'
+            ),
+            status_code=201
+        )
+
+    def test_login(self):
+        self.assertQueryBudget(
+            1,
+            self.add_users,
+            lambda _: self.client.post(
+                '/users/auth/login', {'username': 'member', 'password': 'Query!budget123'}, content_type='application/json'
+            )
+        )
+
+    def test_setup_mfa(self):
+        user = self.create_user('newcomer', mfa=False)
+        self.authenticate(user)
+
+        def seed(count):
+            self.add_users(count)
+            user.mfa_secret = None
+            user.save()
+
+        self.assertQueryBudget(2, seed, lambda _: self.client.post('/users/auth/mfa/setup'))
+
+    def test_verify_mfa(self):
+        self.assertQueryBudget(
+            1,
+            self.add_users,
+            lambda _: self.client.post(
+                '/users/auth/mfa/verify', {'token': pyotp.TOTP(self.user.mfa_secret).now()}, content_type='application/json'
+            )
+        )
+
+    def test_logout(self):
+        self.assertQueryBudget(0, self.add_users, lambda _: self.client.post('/users/auth/logout'))
+
+    def test_disable_mfa(self):
+        def seed(count):
+            self.add_users(count)
+            self.user.mfa_secret = pyotp.random_base32()
+            self.user.save()
+
+        self.assertQueryBudget(2, seed, lambda _: self.client.post('/users/auth/mfa/disable'))
+
+    def test_get_my_info(self):
+        self.assertQueryBudget(0, self.add_users, lambda _: self.client.get('/users/me'))
+
+
+class ClaimsCacheTests(QueryBudgetTestCase):
+    def test_saving_the_user_refreshes_cached_claims(self):
+        user = self.create_user('member')
+        self.authenticate(user)
+        self.assertEqual(self.client.get('/users/me').json()['role'], ROLE_USER)
+
+        user.role = ROLE_GUEST
+        user.save()
+        self.assertEqual(self.client.get('/users/me').json()['role'], ROLE_GUEST)
+
+        user.mfa_secret = None
+        user.save()
+        self.assertEqual(self.client.get('/users/me').status_code, 403)
+
+
+class RefreshCoalescingTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('member')
+        self.refresh_token = jwt.encode(
+            {
+                'user_id': self.user.id,
+                'username': self.user.username,
+                'token_type': 'refresh',
+                'exp': datetime.now(timezone.utc) + timedelta(days=1)
+            },
+            settings.JWT_SETTINGS['SIGNING_KEY'],
+            algorithm=settings.JWT_SETTINGS['ALGORITHM']
+        )
+
+    def get_me_with_refresh_token(self):
+        self.client.cookies.clear()
+        self.client.cookies[settings.JWT_REFRESH_COOKIE_NAME] = self.refresh_token
+        response = self.client.get('/users/me')
+        self.assertEqual(response.status_code, 200)
+        return response.cookies[settings.JWT_COOKIE_NAME].value
+
+    def test_requests_within_the_grace_window_share_the_access_token(self):
+        with self.assertNumQueries(1):
+            access_token = self.get_me_with_refresh_token()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_me_with_refresh_token(), access_token)
+
+        # Once the grace window is over the token is minted again
+        refresh.refreshed_tokens.clear()
+        with mock.patch.object(refresh, 'mint_access_token', wraps=refresh.mint_access_token) as mint:
+            self.get_me_with_refresh_token()
+        mint.assert_called_once_with(self.refresh_token)
+
+    def test_concurrent_refreshes_mint_once(self):
+        calls = []
+
+        def slow_mint(refresh_token):
+            calls.append(refresh_token)
+            time.sleep(0.05)
+            return refresh.RefreshedToken(f'access-{len(calls)}', self.user.id, float('inf'))
+
+        results = []
+        with mock.patch.object(refresh, 'mint_access_token', slow_mint):
+            threads = [
+                threading.Thread(target=lambda: results.append(refresh.refresh_access_token(self.refresh_token)))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({result.access_token for result in results}, {'access-1'})
+        self.assertEqual(refresh.refresh_locks, {})
+
+
+class DecodeCacheTests(QueryBudgetTestCase):
+    def test_verified_tokens_are_decoded_once_until_they_expire(self):
+        self.authenticate(self.create_user('member'))
+        with mock.patch('users.tokens.jwt.decode', wraps=jwt.decode) as decode:
+            for _ in range(3):
+                self.assertEqual(self.client.get('/users/me').status_code, 200)
+        decode.assert_called_once()
+
+        token = self.client.cookies[settings.JWT_COOKIE_NAME].value
+        # Past the token's exp the entry is gone and the token is checked again
+        with mock.patch('utils.lru.time.monotonic', return_value=time.monotonic() + 3600):
+            with mock.patch('users.tokens.jwt.decode', wraps=jwt.decode) as decode:
+                tokens.decode_token(token)
+        decode.assert_called_once()
+
+    def test_tampered_tokens_are_not_served_from_the_cache(self):
+        self.authenticate(self.create_user('member'))
+        self.assertEqual(self.client.get('/users/me').status_code, 200)
+
+        token = self.client.cookies[settings.JWT_COOKIE_NAME].value
+        self.client.cookies[settings.JWT_COOKIE_NAME] = token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB')
+        self.assertEqual(self.client.get('/users/me').status_code, 401)
@@ -0,0 +1,27 @@
+import hashlib
+import time
+import jwt
+from django.conf import settings
+from utils.lru import LRUCache
+
+verified_tokens = LRUCache(settings.JWT_DECODE_CACHE_SIZE)
+
+
+def decode_token(token):
+    """
+    jwt.decode with the configured key and algorithm, answered from a cache of
+    verified payloads keyed by the token's digest. Entries expire at the
+    token's exp, so an expired token is decoded again and rejected.
+    """
+    if not isinstance(token, str) or settings.JWT_DECODE_CACHE_SIZE <= 0:
+        return jwt.decode(token, settings.JWT_SETTINGS['SIGNING_KEY'], algorithms=[settings.JWT_SETTINGS['ALGORITHM']])
+
+    key = hashlib.sha256(token.encode()).digest()
+    payload = verified_tokens.get(key)
+    if payload is None:
+        payload = jwt.decode(token, settings.JWT_SETTINGS['SIGNING_KEY'], algorithms=[settings.JWT_SETTINGS['ALGORITHM']])
+        expires_at = payload.get('exp')
+        # Tokens without an exp never expire and are not worth pinning in the cache
+        if expires_at is not None:
+            verified_tokens.set(key, payload, ttl=expires_at - time.time())
+    return payload
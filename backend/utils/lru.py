@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache of at most `max_size` entries,
+    each expiring `ttl` seconds after it was set (never if ttl is None).
+    With `max_weight`, the weights given to set() are also capped in total.
+    """
+
+    def __init__(self, max_size, ttl=None, max_weight=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.entries = OrderedDict()
+        self.weight = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self.remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, weight=1):
+        """Store `value`, expiring after `ttl` seconds if given and shorter than the cache's own"""
+        if self.max_size <= 0 or (self.max_weight is not None and weight > self.max_weight):
+            return
+        if ttl is None or (self.ttl is not None and self.ttl < ttl):
+            ttl = self.ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (value, expires_at, weight)
+            self.weight += weight
+            while len(self.entries) > self.max_size or (self.max_weight is not None and self.weight > self.max_weight):
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            self.remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.weight = 0
+
+    def remove(self, key):
+        """Drop an entry, the lock must be held"""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'weight': self.weight,
+                'max_weight': self.max_weight,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
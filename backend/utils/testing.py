@@ -0,0 +1,88 @@
+import shutil
+import tempfile
+from datetime import datetime, timezone
+import jwt
+import pyotp
+from django.conf import settings
+from django.test import TestCase, override_settings
+from files.access import share_permission_cache
+from kms.keys import private_key_cache
+from users.claims import get_user_claims, user_claims_cache
+from users.constants import ROLE_USER
+from users.refresh import refreshed_tokens
+from users.tokens import verified_tokens
+from users.models import User
+
+# Table sizes every query budget is checked at
+ROW_COUNTS = (1, 10, 1000)
+
+TEST_JWT_SETTINGS = {
+    **settings.JWT_SETTINGS,
+    'SIGNING_KEY': 'query-budget-test-signing-key',
+    'ALGORITHM': 'HS256',
+}
+
+
+@override_settings(
+    JWT_SETTINGS=TEST_JWT_SETTINGS,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    COOKIE_SECURE=False,
+)
+class QueryBudgetTestCase(TestCase):
+    """
+    Base for tests asserting that an endpoint runs the same number of queries
+    however many rows the tables hold, to catch N+1 regressions.
+    """
+
+    def setUp(self):
+        super().setUp()
+        base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base_dir, ignore_errors=True)
+        self.enterContext(self.settings(BASE_DIR=base_dir))
+        user_claims_cache.clear()
+        share_permission_cache.clear()
+        refreshed_tokens.clear()
+        verified_tokens.clear()
+        private_key_cache.clear()
+        self.authenticated_user = None
+
+    def create_user(self, username, role=ROLE_USER, mfa=True):
+        user = User.objects.create_user(username, 'Query!budget123', role)
+        if mfa:
+            user.mfa_secret = pyotp.random_base32()
+            user.save()
+        return user
+
+    def authenticate(self, user):
+        """Log the test client in as `user` with a freshly signed access token"""
+        token = jwt.encode(
+            {
+                'user_id': user.id,
+                'username': user.username,
+                'role': user.role,
+                'token_type': 'access',
+                'exp': datetime.now(timezone.utc) + settings.JWT_SETTINGS['ACCESS_TOKEN_LIFETIME']
+            },
+            settings.JWT_SETTINGS['SIGNING_KEY'],
+            algorithm=settings.JWT_SETTINGS['ALGORITHM']
+        )
+        self.client.cookies[settings.JWT_COOKIE_NAME] = token
+        self.authenticated_user = user
+
+    def assertQueryBudget(self, budget, seed, make_request, status_code=200):
+        """
+        Grow the data with `seed(count)` to each of ROW_COUNTS rows and check that
+        `make_request()` answers `status_code` with exactly `budget` queries every time.
+        `seed` returns a value handed to `make_request`. Budgets are for the steady
+        state, where the authenticated user's claims are already cached.
+        """
+        seeded = 0
+        for rows in ROW_COUNTS:
+            with self.subTest(rows=rows):
+                context = seed(rows - seeded)
+                seeded = rows
+                if self.authenticated_user:
+                    get_user_claims(self.authenticated_user.id)
+                with self.assertNumQueries(budget):
+                    response = make_request(context)
+                self.assertEqual(response.status_code, status_code, getattr(response, 'content', b'')[:500])